@@ -0,0 +1,48 @@
+import time
+import firebase_admin
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from firebase_admin import credentials, messaging
+from api.tasks import send_messages
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure push throughput of each PUSH_BACKEND, normally against the local FCM stub "
+        "(manage.py fcm_stub --credentials <file>, with FCM_ENDPOINT set to its URL)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000)
+        parser.add_argument('--backends', nargs='+', default=['firebase_admin', 'http2'])
+        parser.add_argument('--credentials', help="Service account to send with instead of the configured one")
+
+    def handle(self, *args, **options):
+        if options['credentials']:
+            if firebase_admin._apps:
+                firebase_admin.delete_app(firebase_admin.get_app())
+            firebase_admin.initialize_app(credentials.Certificate(options['credentials']))
+
+        messages = [
+            messaging.Message(
+                notification=messaging.Notification(title='Bench', body=f'Push {number}'),
+                token=f'bench-token-{number}'
+            ) for number in range(options['messages'])
+        ]
+
+        for backend in options['backends']:
+            with override_settings(PUSH_BACKEND=backend):
+                # Warm up connections and the OAuth token
+                send_messages(messages[:1])
+
+                started = time.perf_counter()
+                succeeded = 0
+                for start in range(0, len(messages), settings.PUSH_BATCH_SIZE):
+                    succeeded += send_messages(messages[start:start + settings.PUSH_BATCH_SIZE]).success_count
+                seconds = time.perf_counter() - started
+
+            self.stdout.write(
+                f"{backend}: {len(messages)} messages in {seconds:.2f}s "
+                f"({len(messages) / seconds:.0f}/s), {succeeded} succeeded"
+            )
@@ -0,0 +1,292 @@
+import json
+import random
+import time
+import tracemalloc
+import uuid
+import redis
+from datetime import timedelta, time as dt_time
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from planmaDB.celery import app
+from api import notification_outbox, presence, tasks
+from api.models import (
+    CustomUser, UserPref, CustomSemester, CustomSubject, CustomTask, CustomEvents,
+    CustomActivity, CustomClassSchedule, Goals, GoalSchedule, ReminderTrigger, FCMToken, REMINDER_BUCKETS
+)
+from api.push_tokens import get_tokens
+from api.presence import get_redis, presence_key, redis_round_trips
+from api.reminder_stats import recent_ticks
+from api.reminders import DEFAULT_REMINDER_OFFSET
+
+# Users seeded per bulk_create round, to bound memory at 100k users
+SEED_CHUNK = 2000
+
+# Items seeded per user; their start times are spread over the coming week
+TASKS_PER_USER = 3
+EVENTS_PER_USER = 2
+ACTIVITIES_PER_USER = 2
+CLASSES_PER_USER = 4
+
+
+def random_time(rng):
+    # Spread uniformly over the day so every minute has some sleep and wake-up reminders due
+    return dt_time(rng.randrange(24), rng.randrange(60))
+
+
+def random_start(now, rng):
+    return (now + timedelta(seconds=rng.randrange(7 * 24 * 3600))).replace(microsecond=0)
+
+
+def trigger_for(category_type, reference_id, student_id, starts_at):
+    return ReminderTrigger(
+        category_type=category_type,
+        reference_id=reference_id,
+        student_id_id=student_id,
+        offset=DEFAULT_REMINDER_OFFSET,
+        starts_at=starts_at,
+        fire_at=starts_at - DEFAULT_REMINDER_OFFSET,
+    )
+
+
+def seed_users(start, count, now, rng, password):
+    """Bulk create `count` users with preferences, a semester, subjects, items, goals and triggers"""
+    today = timezone.localdate(now)
+    users = []
+    for number in range(start, start + count):
+        student_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+        users.append(CustomUser(
+            student_id=student_id,
+            firstname='Bench',
+            lastname=f'User {number}',
+            email=f'bench{number}@planma.test',
+            username=f'bench{number}',
+            password=password,
+            reminder_bucket=student_id.int % REMINDER_BUCKETS,
+        ))
+    CustomUser.objects.bulk_create(users)
+
+    # Most users have installed the app on a device that registered for pushes
+    FCMToken.objects.bulk_create([
+        FCMToken(user=user, token=f'bench-token-{user.student_id}') for user in users if rng.random() < 0.9
+    ])
+
+    prefs = [
+        UserPref(
+            student_id=user,
+            usual_sleep_time=random_time(rng),
+            usual_wake_time=random_time(rng),
+            reminder_offset_time=DEFAULT_REMINDER_OFFSET,
+        ) for user in users
+    ]
+    for pref in prefs:
+        # bulk_create skips save(), which sets the next reminder instants
+        pref.schedule_daily_reminders(now)
+    UserPref.objects.bulk_create(prefs)
+
+    semesters = CustomSemester.objects.bulk_create([
+        CustomSemester(
+            acad_year_start=today.year, acad_year_end=today.year + 1, year_level='1st Year',
+            semester='1st Semester', sem_start_date=today - timedelta(days=60),
+            sem_end_date=today + timedelta(days=60), student_id=user
+        ) for user in users
+    ])
+    subjects = CustomSubject.objects.bulk_create([
+        CustomSubject(
+            subject_code=f'SUBJ{number}', subject_title=f'Subject {number}',
+            student_id=user, semester_id=semester
+        ) for user, semester in zip(users, semesters) for number in range(2)
+    ])
+
+    triggers = []
+
+    starts = [(user, random_start(now, rng)) for user in users for _ in range(TASKS_PER_USER)]
+    items = CustomTask.objects.bulk_create([
+        CustomTask(
+            task_name='Bench task', scheduled_date=timezone.localdate(starts_at),
+            scheduled_start_time=dt_time(8), scheduled_end_time=dt_time(9), deadline=starts_at,
+            subject_id=subjects[index // TASKS_PER_USER * 2], student_id=user
+        ) for index, (user, starts_at) in enumerate(starts)
+    ])
+    triggers += [trigger_for('Task', item.task_id, user.student_id, starts_at) for item, (user, starts_at) in zip(items, starts)]
+
+    for model, category_type, per_user, extra in [
+        (CustomEvents, 'Event', EVENTS_PER_USER, {'event_name': 'Bench event', 'location': 'Hall', 'event_type': 'Academic'}),
+        (CustomActivity, 'Activity', ACTIVITIES_PER_USER, {'activity_name': 'Bench activity', 'status': 'Pending'}),
+    ]:
+        starts = [(user, random_start(now, rng)) for user in users for _ in range(per_user)]
+        items = model.objects.bulk_create([
+            model(
+                scheduled_date=timezone.localdate(starts_at),
+                scheduled_start_time=timezone.localtime(starts_at).time(),
+                scheduled_end_time=dt_time(23, 59), student_id=user, **extra
+            ) for user, starts_at in starts
+        ])
+        triggers += [trigger_for(category_type, item.pk, user.student_id, starts_at) for item, (user, starts_at) in zip(items, starts)]
+
+    starts = [(user, random_start(now, rng)) for user in users for _ in range(CLASSES_PER_USER)]
+    items = CustomClassSchedule.objects.bulk_create([
+        CustomClassSchedule(
+            subject=subjects[index // CLASSES_PER_USER * 2 + index % 2],
+            day_of_week=timezone.localtime(starts_at).strftime('%A'),
+            scheduled_start_time=timezone.localtime(starts_at).time(),
+            scheduled_end_time=dt_time(23, 59), room='Room 1', student_id=user
+        ) for index, (user, starts_at) in enumerate(starts)
+    ])
+    triggers += [trigger_for('Class', item.classsched_id, user.student_id, starts_at) for item, (user, starts_at) in zip(items, starts)]
+
+    ReminderTrigger.objects.bulk_create(triggers, batch_size=5000)
+
+    # Half of the users have a daily goal with a session left today
+    goals = Goals.objects.bulk_create([
+        Goals(
+            goal_name='Bench goal', target_hours=10, timeframe='Daily', goal_type='Academic',
+            student_id=user, semester_id=semester
+        ) for user, semester in zip(users, semesters) if rng.random() < 0.5
+    ])
+    GoalSchedule.objects.bulk_create([
+        GoalSchedule(
+            goal_id=goal, scheduled_date=today, scheduled_start_time=dt_time(20),
+            scheduled_end_time=dt_time(21)
+        ) for goal in goals
+    ])
+
+    return [user.student_id for user in users]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark send_all_reminders against synthetic populations in a throwaway test database "
+        "and Redis database, with an in-memory channel layer and FCM stubbed out"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--output', default='reminder_bench.json', help="Where to write the JSON results")
+        parser.add_argument('--foreground-share', type=float, default=0.1, help="Share of users marked as in the app")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keepdb', action='store_true', help="Reuse the test database between runs")
+        parser.add_argument(
+            '--redis-db', type=int, default=15,
+            help="Database of the REDIS_URL server to run against; it is flushed before each run"
+        )
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=options['keepdb'])
+        always_eager = app.conf.task_always_eager
+        app.conf.task_always_eager = True
+
+        # Keep the bench's tick lease, presence keys and tick stats away from the live ones
+        live_pool = presence.pool
+        presence.pool = redis.ConnectionPool(
+            connection_class=live_pool.connection_class,
+            **{**live_pool.connection_kwargs, 'db': options['redis_db']}
+        )
+
+        results = []
+        try:
+            with override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}):
+                for count in options['users']:
+                    result = self.bench(count, options)
+                    results.append(result)
+                    self.stdout.write(
+                        f"{count} users: tick {result['tick_seconds']}s, relay {result['relay_seconds']}s, "
+                        f"{result['db_queries']} queries, "
+                        f"{result['redis_round_trips']} Redis round trips, "
+                        f"peak {result['peak_memory_bytes'] / 2**20:.1f} MiB, "
+                        f"{result['in_app']} in-app, {result['pushes']} pushes"
+                    )
+        finally:
+            app.conf.task_always_eager = always_eager
+            presence.pool.disconnect()
+            presence.pool = live_pool
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        with open(options['output'], 'w') as f:
+            json.dump({
+                'created_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'shard_count': settings.REMINDER_SHARD_COUNT,
+                'results': results,
+            }, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def bench(self, count, options):
+        call_command('flush', interactive=False, verbosity=0)
+        rng = random.Random(options['seed'])
+        password = make_password('bench-password')
+        now = timezone.now()
+
+        seed_started = time.perf_counter()
+        student_ids = []
+        for start in range(0, count, SEED_CHUNK):
+            student_ids += seed_users(start, min(SEED_CHUNK, count - start), now, rng, password)
+        seed_seconds = time.perf_counter() - seed_started
+
+        r = get_redis()
+        r.flushdb()
+        in_app_users = [student_id for student_id in student_ids if rng.random() < options['foreground_share']]
+        pipe = r.pipeline(transaction=False)
+        for student_id in in_app_users:
+            pipe.set(presence_key(student_id), json.dumps({'foreground': True}), ex=300)
+        pipe.execute()
+
+        pushes = []
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        round_trips = redis_round_trips()
+        tracemalloc.start()
+        started = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            ran = tasks.send_all_reminders.delay().get()
+        tick_seconds = time.perf_counter() - started
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        round_trips = redis_round_trips() - round_trips
+        if not ran:
+            raise CommandError("The reminder tick did not run; another tick holds the lease in the bench Redis database")
+
+        # Drain the outbox as the relay would, with FCM accepting every push to a known token
+        def send_push_batch(batch):
+            tokens = get_tokens(push['user_id'] for push in batch)
+            pushes.extend(push for push in batch if push['user_id'] in tokens)
+            return [
+                {
+                    'user_id': push['user_id'], 'status': 'sent' if push['user_id'] in tokens else 'no_token',
+                    'success': push['user_id'] in tokens, 'message_id': None, 'error': None
+                } for push in batch
+            ]
+
+        relayed = dict.fromkeys(['in_app', 'push'], 0)
+        relay_started = time.perf_counter()
+        with mock.patch.object(notification_outbox, 'send_push_batch', side_effect=send_push_batch):
+            while counts := notification_outbox.relay_outbox_batch():
+                for key in relayed:
+                    relayed[key] += counts[key]
+        relay_seconds = time.perf_counter() - relay_started
+
+        sweeps = recent_ticks(1)[0]['sweeps']
+
+        return {
+            'users': count,
+            'seed_seconds': round(seed_seconds, 3),
+            'tick_seconds': round(tick_seconds, 4),
+            'relay_seconds': round(relay_seconds, 4),
+            'db_queries': queries,
+            'peak_memory_bytes': peak_memory,
+            'redis_round_trips': round_trips,
+            'in_app': relayed['in_app'],
+            'pushes': len(pushes),
+            'sweeps': sweeps,
+        }
@@ -0,0 +1,168 @@
+import heapq
+import json
+import select
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import h2.config
+import h2.connection
+import h2.events
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.core.management.base import BaseCommand
+
+# First bytes of a cleartext HTTP/2 connection made with prior knowledge
+H2_PREFACE = b'PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n'
+
+
+class StubFCMHandler(BaseHTTPRequestHandler):
+    """Answers the OAuth token exchange and FCM v1 sends, over HTTP/1.1 or cleartext HTTP/2.
+
+    Tokens starting with "invalid" are rejected as UNREGISTERED, every other
+    token is accepted. Each send is answered after `latency` seconds, to stand
+    in for the round trip to FCM in throughput benchmarks.
+    """
+    # Keep connections open between requests, as FCM does
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    sent = 0
+    latency = 0
+    lock = threading.Lock()
+
+    def handle(self):
+        if self.request.recv(len(H2_PREFACE), socket.MSG_PEEK | socket.MSG_WAITALL) == H2_PREFACE:
+            return self.handle_h2()
+        super().handle()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path.endswith('/messages:send'):
+            time.sleep(self.latency)
+        self.reply(*self.answer(self.path, body))
+
+    def answer(self, path, body):
+        """Status and JSON payload of the reply to a POST to `path`"""
+        if path == '/token':
+            return 200, {'access_token': 'stub-token', 'token_type': 'Bearer', 'expires_in': 3600}
+
+        if path.endswith('/messages:send'):
+            token = json.loads(body)['message'].get('token', '')
+            if token.startswith('invalid'):
+                return 404, {'error': {
+                    'code': 404,
+                    'message': 'Requested entity was not found.',
+                    'status': 'NOT_FOUND',
+                    'details': [{
+                        '@type': 'type.googleapis.com/google.firebase.fcm.v1.FcmError',
+                        'errorCode': 'UNREGISTERED'
+                    }]
+                }}
+
+            with StubFCMHandler.lock:
+                StubFCMHandler.sent += 1
+                message_id = StubFCMHandler.sent
+            project = path.split('/')[3]
+            return 200, {'name': f'projects/{project}/messages/{message_id}'}
+
+        return 404, {'error': {'code': 404, 'message': 'Not found', 'status': 'NOT_FOUND'}}
+
+    def reply(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_h2(self):
+        """Serve one HTTP/2 connection, answering its multiplexed streams as their latency runs out"""
+        conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False))
+        conn.initiate_connection()
+        self.request.sendall(conn.data_to_send())
+
+        streams = {}
+        # (answer due at, stream id) of requests received in full
+        due = []
+        while True:
+            timeout = max(due[0][0] - time.monotonic(), 0) if due else None
+            if select.select([self.request], [], [], timeout)[0]:
+                data = self.request.recv(65535)
+                if not data:
+                    return
+                for event in conn.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        streams[event.stream_id] = [dict(event.headers)[b':path'].decode(), b'']
+                    elif isinstance(event, h2.events.DataReceived):
+                        streams[event.stream_id][1] += event.data
+                        conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                    elif isinstance(event, h2.events.StreamEnded):
+                        heapq.heappush(due, (time.monotonic() + self.latency, event.stream_id))
+                    elif isinstance(event, h2.events.ConnectionTerminated):
+                        return
+
+            while due and due[0][0] <= time.monotonic():
+                _, stream_id = heapq.heappop(due)
+                status, payload = self.answer(*streams.pop(stream_id))
+                data = json.dumps(payload).encode()
+                conn.send_headers(stream_id, [
+                    (':status', str(status)),
+                    ('content-type', 'application/json'),
+                    ('content-length', str(len(data))),
+                ])
+                conn.send_data(stream_id, data, end_stream=True)
+            self.request.sendall(conn.data_to_send())
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubFCMServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for a sender opening its whole connection pool at once
+    request_queue_size = 256
+
+
+def write_stub_credentials(path, base_url):
+    """Write a throwaway service account whose token exchange goes to the stub"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    with open(path, 'w') as f:
+        json.dump({
+            'type': 'service_account',
+            'project_id': 'planma-stub',
+            'private_key_id': 'stub',
+            'private_key': key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption()
+            ).decode(),
+            'client_email': 'stub@planma-stub.iam.gserviceaccount.com',
+            'client_id': '0',
+            'token_uri': f'{base_url}/token',
+        }, f)
+
+
+class Command(BaseCommand):
+    help = "Run a local stand-in for the FCM v1 API to test push delivery against (set FCM_ENDPOINT to its URL)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=9099)
+        parser.add_argument('--credentials', help="Also write a service account file that authenticates against the stub")
+        parser.add_argument('--latency', type=float, default=0, help="Milliseconds to wait before answering each send")
+
+    def handle(self, *args, **options):
+        base_url = f"http://localhost:{options['port']}"
+        if options['credentials']:
+            write_stub_credentials(options['credentials'], base_url)
+            self.stdout.write(f"Stub service account written to {options['credentials']}")
+
+        StubFCMHandler.latency = options['latency'] / 1000
+        server = StubFCMServer(('localhost', options['port']), StubFCMHandler)
+        self.stdout.write(self.style.SUCCESS(f"FCM stub listening on {base_url}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Messages accepted: {StubFCMHandler.sent}")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from api.models import ReminderTrigger
+from api.reminders import rebuild_reminders
+
+
+class Command(BaseCommand):
+    help = "Recompute the reminder triggers of every pending task, event, activity and class"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--student-id', help="Only rebuild the triggers of this student")
+
+    def handle(self, *args, **options):
+        rebuild_reminders(options['student_id'])
+        pending = ReminderTrigger.objects.filter(fired=False).count()
+        self.stdout.write(self.style.SUCCESS(f"Reminder triggers rebuilt: {pending} pending"))
@@ -0,0 +1,50 @@
+import json
+from django.core.management.base import BaseCommand
+from api.reminder_stats import recent_ticks, summarize_ticks, SWEEP_TOTALS
+
+
+class Command(BaseCommand):
+    help = "Show per-sweep timings and counts of the recent reminder ticks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ticks', type=int, help="Only summarize this many of the latest ticks")
+        parser.add_argument('--json', action='store_true', help="Print the summary as JSON")
+
+    def handle(self, *args, **options):
+        summary = summarize_ticks(recent_ticks(options['ticks']))
+
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+
+        self.stdout.write(
+            f"Lease: {summary['skipped_ticks']} ticks skipped, {summary['coalesced_ticks']} coalesced "
+            f"into {summary['catch_up_runs']} catch-up runs"
+        )
+        self.stdout.write(f"Dead FCM tokens pruned: {summary['pruned_tokens']}")
+        outbox = summary['outbox']
+        self.stdout.write(
+            f"Outbox: {outbox['pending']} pending ({outbox['due']['urgent']} urgent and {outbox['due']['normal']} "
+            f"other due), {outbox['dead_letters']} given up; relayed {outbox['messages']} messages as "
+            f"{outbox['in_app']} in-app and {outbox['push']} pushes, {outbox['skipped']} skipped, "
+            f"{outbox['throttled']} throttled, {outbox['retried']} retries"
+        )
+        throttled = summary['throttled_pushes']
+        self.stdout.write(f"Push rate limit: {throttled['urgent']} urgent and {throttled['normal']} other pushes throttled")
+        if not summary['ticks']:
+            self.stdout.write("No reminder ticks recorded yet")
+            return
+
+        self.stdout.write(
+            f"{summary['ticks']} ticks: last {summary['last_seconds']}s, avg {summary['avg_seconds']}s, "
+            f"max {summary['max_seconds']}s of a {summary['budget_seconds']}s budget"
+        )
+        if summary['near_budget']:
+            self.stdout.write(self.style.WARNING(f"{summary['near_budget']} ticks ran close to the budget"))
+
+        columns = ['avg_seconds', 'max_seconds'] + SWEEP_TOTALS
+        self.stdout.write(f"{'sweep':<10}" + ''.join(f"{column:>18}" for column in columns))
+        for name, sweep in summary['sweeps'].items():
+            self.stdout.write(f"{name:<10}" + ''.join(f"{sweep[column]:>18}" for column in columns))
+
+        self.stdout.write(f"Slowest sweep: {summary['slowest_sweep']}")
@@ -0,0 +1,34 @@
+import time
+import redis
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from api.notification_outbox import relay_outbox_batch
+
+
+class Command(BaseCommand):
+    help = "Deliver the notifications waiting in the outbox to the channel layer and FCM, in batches"
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS("Notification relay started"))
+
+        while True:
+            try:
+                close_old_connections()
+                counts = relay_outbox_batch()
+                if counts:
+                    print(f'Notification relay delivered a batch: {counts}')
+                    # Give the push rate limit a moment to refill instead of reclaiming throttled messages
+                    if not counts['throttled']:
+                        continue
+
+                time.sleep(settings.OUTBOX_POLL_INTERVAL)
+            except KeyboardInterrupt:
+                break
+            except redis.RedisError as e:
+                print(f'Notification relay lost Redis: {str(e)}')
+                time.sleep(1)
+            except Exception as e:
+                # e.g. the database restarting; the batch's lease runs out and it is claimed again
+                print(f'Notification relay failed a batch: {str(e)}')
+                time.sleep(1)
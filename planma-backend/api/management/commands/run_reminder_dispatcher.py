@@ -0,0 +1,48 @@
+import time
+import redis
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+from api.models import ReminderTrigger
+from api.reminder_queue import pop_due, refill_queue, seconds_until_next
+from api.tasks import ReminderDispatch, send_due_triggers
+
+# How often the next hour of triggers is reloaded from the database
+REFILL_INTERVAL = 300
+
+
+class Command(BaseCommand):
+    help = "Send task, event, activity and class reminders within about a second of their trigger time"
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS("Reminder dispatcher started"))
+        next_refill = 0
+
+        while True:
+            try:
+                now = timezone.now()
+
+                if time.monotonic() >= next_refill:
+                    close_old_connections()
+                    queued = refill_queue(now)
+                    next_refill = time.monotonic() + REFILL_INTERVAL
+                    print(f'Reminder queue refilled: {queued} triggers within the next hour')
+
+                trigger_ids = pop_due(now)
+                if trigger_ids:
+                    dispatch = ReminderDispatch()
+                    counts = send_due_triggers(ReminderTrigger.objects.filter(trigger_id__in=trigger_ids), now, dispatch)
+                    print(f'Reminder dispatcher queued {counts} of {len(trigger_ids)} due triggers as {dispatch.written}')
+                    continue
+
+                time.sleep(seconds_until_next(now))
+            except KeyboardInterrupt:
+                break
+            except redis.RedisError as e:
+                print(f'Reminder dispatcher lost Redis: {str(e)}')
+                time.sleep(1)
+            except Exception as e:
+                # e.g. the database restarting; unsent triggers are still picked up by the beat sweep
+                print(f'Reminder dispatcher failed: {str(e)}')
+                close_old_connections()
+                time.sleep(1)
@@ -0,0 +1,97 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:38
+
+import django.db.models.deletion
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+DEFAULT_REMINDER_OFFSET = timedelta(minutes=30)
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def next_class_start(class_schedule, zone, after):
+    """Next start of a weekly class in `zone` strictly after `after`"""
+    local_after = after.astimezone(zone)
+    days_ahead = (WEEKDAYS.index(class_schedule.day_of_week) - local_after.weekday()) % 7
+    starts_at = datetime.combine(local_after.date() + timedelta(days=days_ahead), class_schedule.scheduled_start_time, tzinfo=zone)
+    if starts_at <= after:
+        starts_at += timedelta(days=7)
+    return starts_at
+
+
+def create_triggers(apps, schema_editor):
+    """Arm a trigger for every item that is still ahead, as saving it would have"""
+    ReminderTrigger = apps.get_model('api', 'ReminderTrigger')
+    UserPref = apps.get_model('api', 'UserPref')
+    CustomTask = apps.get_model('api', 'CustomTask')
+    CustomEvents = apps.get_model('api', 'CustomEvents')
+    CustomActivity = apps.get_model('api', 'CustomActivity')
+    CustomClassSchedule = apps.get_model('api', 'CustomClassSchedule')
+
+    now = timezone.now()
+    zone = ZoneInfo(settings.TIME_ZONE)
+    offsets = dict(UserPref.objects.values_list('student_id', 'reminder_offset_time'))
+
+    items = [
+        ('Task', task.task_id, task.student_id_id, task.deadline)
+        for task in CustomTask.objects.exclude(status='Completed').filter(deadline__gt=now)
+    ]
+    items += [
+        ('Event', event.event_id, event.student_id_id,
+         datetime.combine(event.scheduled_date, event.scheduled_start_time, tzinfo=zone))
+        for event in CustomEvents.objects.filter(scheduled_date__gte=now.astimezone(zone).date())
+    ]
+    items += [
+        ('Activity', activity.activity_id, activity.student_id_id,
+         datetime.combine(activity.scheduled_date, activity.scheduled_start_time, tzinfo=zone))
+        for activity in CustomActivity.objects.exclude(status='Completed').filter(
+            scheduled_date__gte=now.astimezone(zone).date()
+        )
+    ]
+    items += [
+        ('Class', class_schedule.classsched_id, class_schedule.student_id_id, next_class_start(class_schedule, zone, now))
+        for class_schedule in CustomClassSchedule.objects.filter(day_of_week__in=WEEKDAYS)
+    ]
+
+    triggers = []
+    for category_type, reference_id, student_id, starts_at in items:
+        if starts_at <= now:
+            continue
+        offset = offsets.get(student_id) or DEFAULT_REMINDER_OFFSET
+        triggers.append(ReminderTrigger(
+            category_type=category_type, reference_id=reference_id, student_id_id=student_id,
+            offset=offset, starts_at=starts_at, fire_at=starts_at - offset,
+        ))
+    ReminderTrigger.objects.bulk_create(triggers, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0043_fcmtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderTrigger',
+            fields=[
+                ('trigger_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('category_type', models.CharField(choices=[('Task', 'Task'), ('Class', 'Class'), ('Event', 'Event'), ('Activity', 'Activity')], max_length=50)),
+                ('reference_id', models.IntegerField()),
+                ('offset', models.DurationField()),
+                ('channel', models.CharField(choices=[('auto', 'Auto'), ('in_app', 'In-App'), ('push', 'Push')], default='auto', max_length=10)),
+                ('starts_at', models.DateTimeField()),
+                ('fire_at', models.DateTimeField()),
+                ('fired', models.BooleanField(default=False)),
+                ('student_id', models.ForeignKey(db_column='student_id', on_delete=django.db.models.deletion.CASCADE, related_name='reminder_triggers', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('fired', False)), fields=['fire_at'], name='remindertrigger_due_idx')],
+                'unique_together': {('category_type', 'reference_id', 'offset', 'channel')},
+            },
+        ),
+        migrations.RunPython(create_triggers, migrations.RunPython.noop),
+    ]
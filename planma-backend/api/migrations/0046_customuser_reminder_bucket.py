@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:44
+
+from django.db import migrations, models
+
+REMINDER_BUCKETS = 1024
+
+
+def assign_reminder_buckets(apps, schema_editor):
+    CustomUser = apps.get_model('api', 'CustomUser')
+    users = list(CustomUser.objects.only('student_id'))
+    for user in users:
+        user.reminder_bucket = user.student_id.int % REMINDER_BUCKETS
+    CustomUser.objects.bulk_update(users, ['reminder_bucket'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0045_userpref_last_wake_reminder_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='reminder_bucket',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(assign_reminder_buckets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:50
+
+from django.db import migrations, models
+
+
+def set_reminder_minutes(apps, schema_editor):
+    UserPref = apps.get_model('api', 'UserPref')
+    prefs = list(UserPref.objects.all())
+    for pref in prefs:
+        offset = int(pref.reminder_offset_time.total_seconds() // 60)
+        sleep, wake = pref.usual_sleep_time, pref.usual_wake_time
+        pref.sleep_reminder_minute = (sleep.hour * 60 + sleep.minute - offset) % 1440
+        pref.wake_reminder_minute = (wake.hour * 60 + wake.minute - 5) % 1440
+    UserPref.objects.bulk_update(prefs, ['sleep_reminder_minute', 'wake_reminder_minute'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0046_customuser_reminder_bucket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userpref',
+            name='sleep_reminder_minute',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userpref',
+            name='wake_reminder_minute',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(set_reminder_minutes, migrations.RunPython.noop),
+    ]
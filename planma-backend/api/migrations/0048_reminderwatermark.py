@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0047_userpref_sleep_reminder_minute_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderWatermark',
+            fields=[
+                ('category', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('swept_until', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:15
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo
+from django.db import migrations, models
+from django.utils import timezone
+
+WAKE_UP_REMINDER_LEAD = timedelta(minutes=5)
+
+
+def next_daily_instant(local_time, lead, time_zone, after):
+    """First UTC instant after `after` that is `lead` before `local_time` on some day in `time_zone`"""
+    zone = ZoneInfo(time_zone)
+    day = after.astimezone(zone).date() - timedelta(days=1)
+    while True:
+        instant = datetime.combine(day, local_time, tzinfo=zone).astimezone(dt_timezone.utc) - lead
+        if instant > after:
+            return instant
+        day += timedelta(days=1)
+
+
+def set_next_reminders(apps, schema_editor):
+    UserPref = apps.get_model('api', 'UserPref')
+    now = timezone.now()
+    prefs = list(UserPref.objects.all())
+    for pref in prefs:
+        pref.next_sleep_reminder_at = next_daily_instant(
+            pref.usual_sleep_time, pref.reminder_offset_time, pref.time_zone, now
+        )
+        pref.next_wake_reminder_at = next_daily_instant(
+            pref.usual_wake_time, WAKE_UP_REMINDER_LEAD, pref.time_zone, now
+        )
+    UserPref.objects.bulk_update(prefs, ['next_sleep_reminder_at', 'next_wake_reminder_at'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0048_reminderwatermark'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='userpref',
+            name='last_wake_reminder_date',
+        ),
+        migrations.RemoveField(
+            model_name='userpref',
+            name='sleep_reminder_minute',
+        ),
+        migrations.RemoveField(
+            model_name='userpref',
+            name='wake_reminder_minute',
+        ),
+        migrations.AddField(
+            model_name='userpref',
+            name='next_sleep_reminder_at',
+            field=models.DateTimeField(db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='userpref',
+            name='next_wake_reminder_at',
+            field=models.DateTimeField(db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='userpref',
+            name='time_zone',
+            field=models.CharField(default='Asia/Manila', max_length=64),
+        ),
+        migrations.RunPython(set_next_reminders, migrations.RunPython.noop),
+    ]
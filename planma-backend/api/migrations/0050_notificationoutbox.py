@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:19
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0049_userpref_time_zone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('outbox_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('channel', models.CharField(choices=[('auto', 'Auto'), ('in_app', 'In-App'), ('push', 'Push')], default='auto', max_length=10)),
+                ('reminder_type', models.CharField(max_length=20)),
+                ('payload', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('student_id', models.ForeignKey(db_column='student_id', on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('available_at__isnull', False)), fields=['available_at', 'student_id'], name='outbox_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0050_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userpref',
+            name='digest_mode',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='userpref',
+            name='quiet_during_classes',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='userpref',
+            name='quiet_hours_end',
+            field=models.TimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userpref',
+            name='quiet_hours_start',
+            field=models.TimeField(blank=True, null=True),
+        ),
+    ]
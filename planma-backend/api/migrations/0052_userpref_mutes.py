@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0051_userpref_quiet_hours'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userpref',
+            name='mute_activity_reminders',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='userpref',
+            name='mute_class_reminders',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='userpref',
+            name='mute_event_reminders',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='userpref',
+            name='mute_goal_reminders',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='userpref',
+            name='mute_in_app',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='userpref',
+            name='mute_push',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='userpref',
+            name='mute_sleep_reminders',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='userpref',
+            name='mute_task_reminders',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='userpref',
+            name='mute_wake_reminders',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:25
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def dedupe_tokens(apps, schema_editor):
+    # A device signed in to several accounts keeps only its latest registration
+    FCMToken = apps.get_model('api', 'FCMToken')
+    seen = set()
+    duplicates = []
+    for token_id, token in FCMToken.objects.order_by('-updated_at').values_list('id', 'token'):
+        if token in seen:
+            duplicates.append(token_id)
+        seen.add(token)
+    FCMToken.objects.filter(id__in=duplicates).delete()
+    FCMToken.objects.update(last_seen=models.F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0052_userpref_mutes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fcmtoken',
+            name='last_seen',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(dedupe_tokens, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='fcmtoken',
+            name='token',
+            field=models.TextField(unique=True),
+        ),
+        migrations.AlterField(
+            model_name='fcmtoken',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fcm_tokens', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:55
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0053_fcmtoken_devices'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='customactivity',
+            name='reminder_sent',
+        ),
+        migrations.RemoveField(
+            model_name='customevents',
+            name='reminder_sent',
+        ),
+        migrations.RemoveField(
+            model_name='customtask',
+            name='reminder_sent',
+        ),
+    ]
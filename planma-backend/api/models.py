@@ -1,13 +1,35 @@
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo, available_timezones
 from django.db import models
 from django.forms import ValidationError
 from django.utils import timezone
+from django.utils.dateparse import parse_time
 from django.contrib.auth.models import AbstractBaseUser,PermissionsMixin
 from django.contrib.auth.base_user import BaseUserManager
 import uuid
 from django.conf import settings
 from django_enumfield import enum
 
+# Number of buckets users are hashed into so the reminder sweep can be split into shards
+REMINDER_BUCKETS = 1024
+
+# Wake-up reminders go out this long before the wake-up time
+WAKE_UP_REMINDER_LEAD = timedelta(minutes=5)
+
+
+def next_daily_instant(local_time, lead, time_zone, after):
+    """First UTC instant after `after` that is `lead` before `local_time` on some day in `time_zone`"""
+    local_time = parse_time(local_time) if isinstance(local_time, str) else local_time
+    zone = ZoneInfo(time_zone)
+    day = after.astimezone(zone).date() - timedelta(days=1)
+    while True:
+        # The lead is taken off in UTC so it stays exact across a DST change
+        instant = datetime.combine(day, local_time, tzinfo=zone).astimezone(dt_timezone.utc) - lead
+        if instant > after:
+            return instant
+        day += timedelta(days=1)
+
+
 class AppUserManager(BaseUserManager):
     def create_user(self,firstname, lastname, email, username, password=None):
             if not email:
@@ -50,6 +72,8 @@ class CustomUser(AbstractBaseUser,PermissionsMixin):
     )  
     is_staff=models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
+    # Derived from student_id; the reminder sweep assigns users to shards by bucket range
+    reminder_bucket = models.PositiveSmallIntegerField(default=0, editable=False, db_index=True)
     objects = AppUserManager()
 
     USERNAME_FIELD = 'email'
@@ -59,6 +83,10 @@ class CustomUser(AbstractBaseUser,PermissionsMixin):
     def __str__(self):  # Fixed str method
         return self.email
 
+    def save(self, *args, **kwargs):
+        self.reminder_bucket = self.student_id.int % REMINDER_BUCKETS
+        super().save(*args, **kwargs)
+
 
 class CustomEvents(models.Model):
      # Primary Key
@@ -79,12 +107,10 @@ class CustomEvents(models.Model):
         related_name='events', db_column="student_id"
     )
 
-    # New attribute for tracking reminder
-    reminder_sent = models.BooleanField(default=False)
-
     def delete(self, *args, **kwargs):
-        # Manually delete related ScheduleEntry before deleting this task
+        # Manually delete related ScheduleEntry and reminder triggers before deleting this task
         ScheduleEntry.objects.filter(category_type='Event', reference_id=self.event_id).delete()
+        ReminderTrigger.objects.filter(category_type='Event', reference_id=self.event_id).delete()
         super().delete(*args, **kwargs)
 
     def __str__(self):
@@ -128,12 +154,10 @@ class CustomActivity(models.Model):
         related_name='activity', db_column='student_id'
     )
 
-    # New attribute for tracking reminder
-    reminder_sent = models.BooleanField(default=False)
-
     def delete(self, *args, **kwargs):
-        # Manually delete related ScheduleEntry before deleting this task
+        # Manually delete related ScheduleEntry and reminder triggers before deleting this task
         ScheduleEntry.objects.filter(category_type='Activity', reference_id=self.activity_id).delete()
+        ReminderTrigger.objects.filter(category_type='Activity', reference_id=self.activity_id).delete()
         super().delete(*args, **kwargs)
 
     def __str__(self):
@@ -156,6 +180,10 @@ class ActivityTimeLog(models.Model):
     date_logged = models.DateField()
 
 
+# Changing any of these moves the next sleep and wake-up reminders
+DAILY_REMINDER_FIELDS = ['usual_sleep_time', 'usual_wake_time', 'reminder_offset_time', 'time_zone']
+
+
 class UserPref(models.Model):
     # Primary Key
     pref_id = models.AutoField(primary_key=True)
@@ -173,27 +201,110 @@ class UserPref(models.Model):
         db_index=True
     )
 
+    # IANA time zone the sleep and wake times, and the user's schedule, are in
+    time_zone = models.CharField(max_length=64, default=settings.TIME_ZONE)
+
     # New field to track the last sleep reminder date
     last_sleep_reminder_date = models.DateField(null=True, blank=True)
 
+    # Daily window, in time_zone, during which non-urgent reminders are held until it ends; may span midnight
+    quiet_hours_start = models.TimeField(null=True, blank=True)
+    quiet_hours_end = models.TimeField(null=True, blank=True)
+    # Hold non-urgent reminders while one of the user's classes is in session
+    quiet_during_classes = models.BooleanField(default=False)
+    # Collect non-urgent reminders and send them together every REMINDER_DIGEST_INTERVAL
+    digest_mode = models.BooleanField(default=False)
+
+    # Reminder categories and channels the user opted out of; muting both channels mutes everything
+    mute_task_reminders = models.BooleanField(default=False)
+    mute_event_reminders = models.BooleanField(default=False)
+    mute_activity_reminders = models.BooleanField(default=False)
+    mute_class_reminders = models.BooleanField(default=False)
+    mute_goal_reminders = models.BooleanField(default=False)
+    mute_sleep_reminders = models.BooleanField(default=False)
+    mute_wake_reminders = models.BooleanField(default=False)
+    mute_push = models.BooleanField(default=False)
+    mute_in_app = models.BooleanField(default=False)
+
+    # Next instants the sleep and wake-up reminders fire, kept in sync by save() and the reminder sweeps
+    next_sleep_reminder_at = models.DateTimeField(null=True, editable=False, db_index=True)
+    next_wake_reminder_at = models.DateTimeField(null=True, editable=False, db_index=True)
+
     def __str__(self):
         return f"User Preferences for {self.student_id.username} | Student ID: {self.student_id.student_id}"
 
     def clean(self):
         if self.usual_sleep_time >= self.usual_wake_time:
             raise ValidationError("Sleep time must be before wake time.")
-        
+        if self.time_zone not in available_timezones():
+            raise ValidationError(f"Unknown time zone: {self.time_zone}")
+        if (self.quiet_hours_start is None) != (self.quiet_hours_end is None):
+            raise ValidationError("Quiet hours need both a start and an end.")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user_pref = super().from_db(db, field_names, values)
+        user_pref._scheduled_from = user_pref.daily_reminder_source()
+        return user_pref
+
+    def daily_reminder_source(self):
+        """The loaded fields the sleep and wake-up reminder instants are computed from, or None if any is deferred"""
+        if any(name not in self.__dict__ for name in DAILY_REMINDER_FIELDS):
+            return None
+        return tuple(
+            parse_time(value) if isinstance(value, str) else value
+            for value in (getattr(self, name) for name in DAILY_REMINDER_FIELDS)
+        )
+
     def save(self, *args, **kwargs):
         # Ensure `reminder_offset_time` is stored as a timedelta
         if isinstance(self.reminder_offset_time, (int, float, str)):
             self.reminder_offset_time = timedelta(seconds=int(self.reminder_offset_time))
+
+        # Other changes keep the pending instants, so a reminder due but not yet sent is not moved to tomorrow
+        if (
+            self._state.adding or self.next_sleep_reminder_at is None or self.next_wake_reminder_at is None
+            or getattr(self, '_scheduled_from', None) != self.daily_reminder_source()
+        ):
+            self.schedule_daily_reminders()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'next_sleep_reminder_at', 'next_wake_reminder_at'}
         super().save(*args, **kwargs)
+        self._scheduled_from = self.daily_reminder_source()
+
+    def schedule_daily_reminders(self, after=None):
+        """Set the next sleep and wake-up reminder instants after `after` (defaults to now)"""
+        after = after or timezone.now()
+        self.next_sleep_reminder_at = next_daily_instant(
+            self.usual_sleep_time, self.reminder_offset_time, self.time_zone, after
+        )
+        self.next_wake_reminder_at = next_daily_instant(
+            self.usual_wake_time, WAKE_UP_REMINDER_LEAD, self.time_zone, after
+        )
+
+    def mutes(self, category):
+        """Whether the user gets no reminders of `category`, one of REMINDER_MUTE_FIELDS"""
+        return getattr(self, REMINDER_MUTE_FIELDS[category]) or (self.mute_push and self.mute_in_app)
 
     class Meta:
         verbose_name = "User Preference"
         verbose_name_plural = "User Preferences"
 
 
+# UserPref field muting each reminder category
+REMINDER_MUTE_FIELDS = {
+    'Task': 'mute_task_reminders',
+    'Event': 'mute_event_reminders',
+    'Activity': 'mute_activity_reminders',
+    'Class': 'mute_class_reminders',
+    'goal': 'mute_goal_reminders',
+    'sleep': 'mute_sleep_reminders',
+    'wake': 'mute_wake_reminders',
+}
+# Preferences of users who opted out of both channels
+MUTED_EVERYWHERE = models.Q(mute_push=True, mute_in_app=True)
+
+
 class CustomSemester(models.Model):
     YEAR_LEVEL_CHOICES = [
         ('1st Year', '1st Year'),
@@ -282,6 +393,11 @@ class CustomClassSchedule(models.Model):
     class Meta:
         unique_together = ('subject', 'day_of_week', 'scheduled_start_time', 'scheduled_end_time', 'room', 'student_id')
 
+    def delete(self, *args, **kwargs):
+        # Manually delete related reminder triggers before deleting this class schedule
+        ReminderTrigger.objects.filter(category_type='Class', reference_id=self.classsched_id).delete()
+        super().delete(*args, **kwargs)
+
     def __str__(self):
         # < MIGHT CAUSE ISSUES >
         # Access the related CustomSubject's title
@@ -341,17 +457,10 @@ class CustomTask(models.Model):
         related_name='tasks', db_column="student_id"
     )
 
-    """
-    Added reminder set:
-    This approach will check all users' tasks on every run of the scheduled task. 
-    If your application has many users, you might want to consider more advanced 
-    scheduling approaches, but this should work for a moderate number of users.
-    """
-    reminder_sent = models.BooleanField(default=False)
-
     def delete(self, *args, **kwargs):
-        # Manually delete related ScheduleEntry before deleting this task
+        # Manually delete related ScheduleEntry and reminder triggers before deleting this task
         ScheduleEntry.objects.filter(category_type='Task', reference_id=self.task_id).delete()
+        ReminderTrigger.objects.filter(category_type='Task', reference_id=self.task_id).delete()
         super().delete(*args, **kwargs)
 
     def __str__(self):
@@ -503,9 +612,98 @@ class ScheduleEntry(models.Model):
 
 
 class FCMToken(models.Model):
-    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    token = models.TextField()
+    # One row per device the user is signed in on
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='fcm_tokens')
+    # A token identifies one app install, so it belongs to whichever user registered it last
+    token = models.TextField(unique=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # When the device last registered; devices unseen for FCM_DEVICE_STALE_AFTER are removed
+    last_seen = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.user.username}'s FCM Token (last seen {self.last_seen})"
+
+
+class ReminderTrigger(models.Model):
+    CATEGORY_CHOICES = [
+        ('Task', 'Task'),
+        ('Class', 'Class'),
+        ('Event', 'Event'),
+        ('Activity', 'Activity'),
+    ]
+    CHANNEL_CHOICES = [
+        ('auto', 'Auto'),  # In-app when the user is in the foreground, push otherwise
+        ('in_app', 'In-App'),
+        ('push', 'Push'),
+    ]
+    # Primary Key
+    trigger_id = models.BigAutoField(primary_key=True)
+
+    # Trigger Details
+    category_type = models.CharField(max_length=50, choices=CATEGORY_CHOICES)
+    reference_id = models.IntegerField()
+    # Foreign Key to CustomUser model
+    student_id = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='reminder_triggers', db_column='student_id'
+    )
+    offset = models.DurationField()
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES, default='auto')
+    # Deadline or start of the item, and the instant the reminder is due (starts_at - offset)
+    starts_at = models.DateTimeField()
+    fire_at = models.DateTimeField()
+    fired = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ('category_type', 'reference_id', 'offset', 'channel')
+        indexes = [
+            # Only unfired triggers are ever range-scanned by the reminder tick
+            models.Index(fields=['fire_at'], condition=models.Q(fired=False), name='remindertrigger_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.category_type} {self.reference_id} | {self.channel} | fires {self.fire_at}"
+
+
+class ReminderWatermark(models.Model):
+    # Label of a reminder sweep, as in api.tasks.REMINDER_SWEEPS
+    category = models.CharField(max_length=20, primary_key=True)
+    # Start of the last tick that completed the sweep; everything due up to it has been handled
+    swept_until = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.category} swept until {self.swept_until}"
+
+
+class NotificationOutbox(models.Model):
+    # Primary Key
+    outbox_id = models.BigAutoField(primary_key=True)
+
+    # Foreign Key to CustomUser model
+    student_id = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='outbox', db_column='student_id'
+    )
+    channel = models.CharField(max_length=10, choices=ReminderTrigger.CHANNEL_CHOICES, default='auto')
+    reminder_type = models.CharField(max_length=20)
+    # {'reminder', 'title', 'body'} as the consumer and the push expect them
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # When the relay may next pick the message up; null once it gave up after OUTBOX_MAX_ATTEMPTS
+    available_at = models.DateTimeField(null=True, default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # The relay takes due messages in this order, so a user's messages of one tick stay together
+            models.Index(
+                fields=['available_at', 'student_id'], condition=models.Q(available_at__isnull=False),
+                name='outbox_pending_idx'
+            ),
+        ]
 
     def __str__(self):
-        return f"{self.user.username}'s FCM Token"
\ No newline at end of file
+        return f"{self.reminder_type} for {self.student_id_id} | {self.channel} | attempt {self.attempts}"
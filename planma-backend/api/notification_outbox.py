@@ -0,0 +1,208 @@
+import json
+from datetime import timedelta
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import NotificationOutbox, UserPref
+from .presence import get_foreground_users
+from .reminder_stats import RELAY_COUNTERS, record_relay_counts
+from .tasks import send_push_batch
+
+# Push results worth another attempt; dead tokens and users without one are settled as is
+RETRY_STATUSES = {'transient', 'error'}
+
+
+def notify(student_id, title, body, reminder_type='notification', reminder=None, channel='push'):
+    """Queue a notification for the relay, in the caller's transaction"""
+    return NotificationOutbox.objects.create(
+        student_id_id=student_id, channel=channel, reminder_type=reminder_type,
+        payload={'reminder': reminder, 'title': title, 'body': body}
+    )
+
+
+def get_muted_channels(student_ids):
+    """(mute_push, mute_in_app) of each of `student_ids` who muted a channel"""
+    return {
+        student_id: (mute_push, mute_in_app)
+        for student_id, mute_push, mute_in_app in UserPref.objects.filter(
+            Q(mute_push=True) | Q(mute_in_app=True), student_id__in=student_ids
+        ).values_list('student_id', 'mute_push', 'mute_in_app')
+    }
+
+
+def combine_reminders(messages):
+    """Title, body and data of the one push carrying all of a user's outbox `messages`.
+
+    FCM rejects pushes over 4 KB, so only as many reminders as fit in PUSH_PAYLOAD_LIMIT
+    bytes are listed; the rest are summed up as "and K more".
+    """
+    if len(messages) == 1:
+        title = messages[0].payload['title']
+    else:
+        title = f"You have {len(messages)} reminders"
+
+    items, lines = [], []
+    for index, message in enumerate(messages):
+        item = {
+            'reminder_type': message.reminder_type,
+            'id': message.payload['reminder'].get('id') if isinstance(message.payload['reminder'], dict) else None,
+            'title': message.payload['title'],
+        }
+        rest = len(messages) - index - 1
+        if items and payload_size(title, lines + [message.payload['body']], items + [item], rest) > settings.PUSH_PAYLOAD_LIMIT:
+            break
+        items.append(item)
+        lines.append(message.payload['body'])
+
+    if len(items) < len(messages):
+        lines.append(f"and {len(messages) - len(items)} more")
+    # FCM data values must be strings
+    return {'title': title, 'body': '\n'.join(lines), 'data': {'reminders': json.dumps(items)}}
+
+
+def payload_size(title, lines, items, rest):
+    """Bytes of a combined push's title, body and data, counting the "and K more" line for `rest` left out"""
+    if rest:
+        lines = lines + [f"and {rest} more"]
+    return len(title.encode()) + len('\n'.join(lines).encode()) + len(json.dumps(items).encode())
+
+
+def claim_outbox_batch(now):
+    """Lease up to OUTBOX_BATCH_SIZE due messages to this relay, urgent ones first, counting the attempt"""
+    urgent = Q(reminder_type__in=settings.PUSH_URGENT_TYPES)
+    with transaction.atomic():
+        messages = []
+        # Urgent reminders jump the queue when a backlog builds up behind the push rate limit
+        for lane in (urgent, ~urgent):
+            limit = settings.OUTBOX_BATCH_SIZE - len(messages)
+            if limit:
+                messages += (
+                    NotificationOutbox.objects.select_for_update(skip_locked=True)
+                    .filter(lane, available_at__lte=now)
+                    .order_by('available_at', 'student_id')[:limit]
+                )
+        NotificationOutbox.objects.filter(pk__in=[message.pk for message in messages]).update(
+            available_at=now + settings.OUTBOX_LEASE, attempts=F('attempts') + 1
+        )
+    for message in messages:
+        message.attempts += 1
+    return messages
+
+
+def settle_outbox_batch(delivered, failed, throttled, now):
+    """Delete the delivered messages; schedule a retry of the failed ones, or give up on them.
+
+    Throttled messages were not attempted, so they go back to the queue for once the rate
+    limit lets them through, without counting the attempt.
+    """
+    NotificationOutbox.objects.filter(pk__in=[message.pk for message in delivered]).delete()
+
+    for message, retry_after in throttled:
+        message.available_at = now + timedelta(seconds=retry_after)
+        message.attempts -= 1
+    NotificationOutbox.objects.bulk_update([message for message, _ in throttled], ['available_at', 'attempts'])
+
+    given_up = 0
+    for message, error in failed:
+        message.last_error = error
+        if message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            message.available_at = None
+            given_up += 1
+        else:
+            message.available_at = now + settings.OUTBOX_RETRY_DELAY * 2 ** (message.attempts - 1)
+    NotificationOutbox.objects.bulk_update([message for message, _ in failed], ['available_at', 'last_error'])
+
+    if given_up:
+        print(f'Notification relay gave up on {given_up} messages after {settings.OUTBOX_MAX_ATTEMPTS} attempts')
+    return given_up
+
+
+def settle_relayed(counts, delivered, failed, throttled, now):
+    """Settle part of a batch, adding its retries and given up messages to the batch's `counts`"""
+    given_up = settle_outbox_batch(delivered, failed, throttled, now)
+    counts['given_up'] += given_up
+    counts['retried'] += len(failed) - given_up
+
+
+def relay_outbox_batch(now=None):
+    """Deliver one batch of due outbox messages, each user's as one in-app message or one push.
+
+    Returns the batch's counts, or None when nothing was due.
+    """
+    now = now or timezone.now()
+    messages = claim_outbox_batch(now)
+    if not messages:
+        return None
+
+    counts = dict.fromkeys(RELAY_COUNTERS, 0)
+    counts['messages'] = len(messages)
+    delivered, failed = [], []
+
+    # Presence is read at delivery, so a user who opened the app meanwhile gets the reminder in-app
+    student_ids = {message.student_id_id for message in messages}
+    foreground_users = get_foreground_users(student_ids)
+    muted_channels = get_muted_channels(student_ids)
+    in_app, push = {}, {}
+    for message in messages:
+        mute_push, mute_in_app = muted_channels.get(message.student_id_id, (False, False))
+        if message.channel != 'push' and message.student_id_id in foreground_users and not mute_in_app:
+            in_app.setdefault(message.student_id_id, []).append(message)
+        elif message.channel != 'in_app' and not mute_push:
+            push.setdefault(message.student_id_id, []).append(message)
+        else:
+            # In-app only reminder for a user who is not in the app, or a channel the user muted
+            counts['skipped'] += 1
+            delivered.append(message)
+
+    channel_layer = get_channel_layer()
+    for student_id, user_messages in in_app.items():
+        try:
+            async_to_sync(channel_layer.group_send)(
+                f'user_{student_id}',
+                {
+                    'type': 'reminder_notifications',
+                    'reminders': [
+                        {'reminder_type': message.reminder_type, 'reminder': message.payload['reminder']}
+                        for message in user_messages
+                    ]
+                }
+            )
+        except Exception as e:
+            failed += [(message, f'Channel layer: {str(e)}') for message in user_messages]
+            continue
+        counts['in_app'] += 1
+        delivered += user_messages
+
+    # Settle the in-app messages before pushing, so a failed push phase never sends them again
+    settle_relayed(counts, delivered, failed, [], now)
+
+    pushes = [
+        {
+            'user_id': str(student_id),
+            'urgent': any(message.reminder_type in settings.PUSH_URGENT_TYPES for message in user_messages),
+            **combine_reminders(user_messages)
+        } for student_id, user_messages in push.items()
+    ]
+    push_messages = list(push.values())
+    for start in range(0, len(pushes), settings.PUSH_BATCH_SIZE):
+        results = send_push_batch(pushes[start:start + settings.PUSH_BATCH_SIZE])
+        delivered, failed, throttled = [], [], []
+
+        for user_messages, result in zip(push_messages[start:start + settings.PUSH_BATCH_SIZE], results):
+            if result['status'] == 'throttled':
+                throttled += [(message, result['retry_after']) for message in user_messages]
+                counts['throttled'] += len(user_messages)
+                continue
+            if result['status'] in RETRY_STATUSES:
+                failed += [(message, f"FCM: {result['error']}") for message in user_messages]
+                continue
+            counts['push' if result['success'] else 'skipped'] += 1
+            delivered += user_messages
+
+        settle_relayed(counts, delivered, failed, throttled, now)
+
+    record_relay_counts(counts)
+    return counts
@@ -0,0 +1,69 @@
+import json
+import redis
+from django.conf import settings
+from django.utils.timezone import now
+
+class RoundTripCounter:
+    """Mixed into the pool's connection class to count requests sent to Redis (a pipeline counts once)"""
+    count = 0
+
+    def send_packed_command(self, command, check_health=True):
+        RoundTripCounter.count += 1
+        return super().send_packed_command(command, check_health)
+
+
+# One connection pool per process, shared by the reminder sweeps and the websocket consumers
+pool = redis.ConnectionPool.from_url(settings.REDIS_URL)
+pool.connection_class = type(
+    f'Counted{pool.connection_class.__name__}', (RoundTripCounter, pool.connection_class), {}
+)
+
+
+def get_redis():
+    return redis.Redis(connection_pool=pool)
+
+
+def redis_round_trips():
+    return RoundTripCounter.count
+
+
+def presence_key(student_id):
+    return f"user_online:{student_id}"
+
+
+def set_foreground(student_id, foreground):
+    """Record whether the user's app is open, expiring after 5 minutes without a refresh"""
+    key = presence_key(student_id)
+    if foreground:
+        get_redis().set(key, json.dumps({
+            "last_seen": now().isoformat(),
+            "foreground": True
+        }), ex=300)
+    else:
+        get_redis().delete(key)
+
+
+def _is_foreground(value):
+    if value is None:
+        return False
+    try:
+        return json.loads(value).get("foreground", False)
+    except (ValueError, AttributeError):
+        return False
+
+
+def get_foreground_users(student_ids):
+    """Subset of `student_ids` whose app is in the foreground, resolved in a single MGET"""
+    student_ids = list(set(student_ids))
+    if not student_ids:
+        return set()
+
+    values = get_redis().mget([presence_key(student_id) for student_id in student_ids])
+    return {
+        student_id for student_id, value in zip(student_ids, values)
+        if _is_foreground(value)
+    }
+
+
+def is_user_in_foreground(student_id):
+    return student_id in get_foreground_users([student_id])
@@ -0,0 +1,70 @@
+import time
+from django.conf import settings
+from .presence import get_redis
+
+BUCKET_KEY = 'push:rate_limit'
+THROTTLED_KEY = 'push:throttled'
+
+# Pushes in the urgent lane may empty the bucket; the normal lane leaves PUSH_URGENT_RESERVE in it
+LANES = ['urgent', 'normal']
+
+# Refill the bucket for the time since it was last used, then take the costs in order while
+# they fit above the lane's floor. Returns how many fit and, as a string since Lua numbers
+# are truncated, the seconds until the next one would.
+ACQUIRE_SCRIPT = """
+local rate, burst, floor, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or burst
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+
+local granted = 0
+for i = 5, #ARGV do
+    local cost = tonumber(ARGV[i])
+    if tokens - cost < floor then
+        break
+    end
+    tokens = tokens - cost
+    granted = granted + 1
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(math.max(now, updated_at)))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+
+local wait = 0
+if granted < #ARGV - 4 then
+    wait = (floor + tonumber(ARGV[granted + 5]) - tokens) / rate
+end
+return {granted, tostring(wait)}
+"""
+
+
+def acquire_push_quota(costs, lane):
+    """How many of `costs` (FCM messages per push, in send order) may be sent now in `lane`,
+    and the seconds until the next of them could be.
+
+    Every push worker draws from the same Redis bucket, which refills at PUSH_RATE_LIMIT
+    messages per second up to PUSH_RATE_BURST.
+    """
+    if not costs:
+        return 0, 0
+    floor = settings.PUSH_URGENT_RESERVE if lane == 'normal' else 0
+    # A push larger than the lane can ever hold would otherwise wait forever
+    capacity = settings.PUSH_RATE_BURST - floor
+    granted, wait = get_redis().register_script(ACQUIRE_SCRIPT)(
+        keys=[BUCKET_KEY],
+        args=[
+            settings.PUSH_RATE_LIMIT, settings.PUSH_RATE_BURST, floor, time.time(),
+            *[min(cost, capacity) for cost in costs]
+        ]
+    )
+    throttled = len(costs) - granted
+    if throttled:
+        get_redis().hincrby(THROTTLED_KEY, lane, throttled)
+    return granted, float(wait)
+
+
+def throttled_counts():
+    """Pushes held back by the rate limiter so far, per lane"""
+    throttled = get_redis().hgetall(THROTTLED_KEY)
+    return {lane: int(throttled.get(lane.encode(), 0)) for lane in LANES}
@@ -0,0 +1,120 @@
+import json
+import redis
+from django.conf import settings
+from django.db.models import Q
+from firebase_admin import exceptions, messaging
+from .models import FCMToken
+from .presence import get_redis
+
+PRUNED_KEY = 'push:pruned_tokens'
+
+# Send outcomes after which FCM will never accept the token again
+DEAD_TOKEN_STATUSES = {'unregistered', 'invalid_token', 'sender_mismatch'}
+
+
+def token_key(user_id):
+    return f"fcm_tokens:{user_id}"
+
+
+def forget_tokens(user_ids):
+    """Drop the cached device tokens of `user_ids` after their devices changed; the next lookup reloads them"""
+    try:
+        get_redis().delete(*[token_key(user_id) for user_id in user_ids])
+    except redis.RedisError as e:
+        # The stale entries expire on their own
+        print(f'Error updating FCM token cache for users {list(user_ids)}: {str(e)}')
+
+
+def get_tokens(user_ids):
+    """Map each of `user_ids` with a registered device to its devices' FCM tokens, reading the database only for cache misses"""
+    user_ids = list({str(user_id) for user_id in user_ids})
+    if not user_ids:
+        return {}
+
+    r = get_redis()
+    cached = r.mget([token_key(user_id) for user_id in user_ids])
+    # An empty list is cached for users without a device, so they are skipped without a database read
+    tokens = {
+        user_id: json.loads(value) for user_id, value in zip(user_ids, cached)
+        if value is not None and value != b'[]'
+    }
+    missing = [user_id for user_id, value in zip(user_ids, cached) if value is None]
+
+    if missing:
+        found = {}
+        for user_id, token in FCMToken.objects.filter(user_id__in=missing).order_by('-last_seen').values_list('user_id', 'token'):
+            found.setdefault(str(user_id), []).append(token)
+        tokens.update(found)
+
+        pipe = r.pipeline(transaction=False)
+        for user_id in missing:
+            if user_id in found:
+                pipe.set(token_key(user_id), json.dumps(found[user_id]), ex=settings.FCM_TOKEN_CACHE_TTL)
+            else:
+                pipe.set(token_key(user_id), '[]', ex=settings.FCM_NO_TOKEN_CACHE_TTL)
+        pipe.execute()
+
+    return tokens
+
+
+def blames_token(exception):
+    """Whether FCM rejected a request as malformed because of its registration token"""
+    try:
+        details = exception.http_response.json()['error'].get('details', [])
+    except Exception:
+        details = []
+    for detail in details:
+        if any(violation.get('field') == 'message.token' for violation in detail.get('fieldViolations', [])):
+            return True
+    return 'registration token' in str(exception).lower()
+
+
+def classify_send_error(exception):
+    """Status of a failed send: a dead token, a transient failure worth retrying, or any other error"""
+    if isinstance(exception, messaging.UnregisteredError):
+        return 'unregistered'
+    if isinstance(exception, messaging.SenderIdMismatchError):
+        return 'sender_mismatch'
+    # A malformed request is only the token's fault when FCM says so; an oversized payload is not
+    if isinstance(exception, exceptions.InvalidArgumentError) and blames_token(exception):
+        return 'invalid_token'
+    if isinstance(exception, (
+        messaging.QuotaExceededError, exceptions.UnavailableError,
+        exceptions.InternalError, exceptions.DeadlineExceededError
+    )):
+        return 'transient'
+    return 'error'
+
+
+def prune_tokens(dead_tokens):
+    """Delete device tokens FCM permanently rejected, given as (user_id, token) pairs, and return how many were removed.
+
+    Only rows still registered to that user are deleted, so a device that moved
+    to another account in the meantime is kept.
+    """
+    if not dead_tokens:
+        return 0
+
+    matches = Q()
+    for user_id, token in dead_tokens:
+        matches |= Q(user_id=user_id, token=token)
+    return delete_tokens(FCMToken.objects.filter(matches))
+
+
+def delete_tokens(queryset):
+    """Delete the device tokens in `queryset`, dropping their users' cached tokens and counting them as pruned"""
+    rows = list(queryset.values_list('id', 'user_id'))
+    if not rows:
+        return 0
+    FCMToken.objects.filter(id__in=[row_id for row_id, _ in rows]).delete()
+
+    forget_tokens({user_id for _, user_id in rows})
+    try:
+        get_redis().incrby(PRUNED_KEY, len(rows))
+    except redis.RedisError as e:
+        print(f'Error counting pruned FCM tokens: {str(e)}')
+    return len(rows)
+
+
+def pruned_token_count():
+    return int(get_redis().get(PRUNED_KEY) or 0)
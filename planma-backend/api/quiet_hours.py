@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo
+from django.conf import settings
+from django.db.models import Q
+from .models import UserPref, CustomClassSchedule
+from .reminders import WEEKDAYS
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def window_end(start, end, local_now):
+    """End of the daily `start`-`end` window `local_now` falls in, or None outside it"""
+    today, now_time = local_now.date(), local_now.time()
+    if start <= end:
+        inside = start <= now_time < end
+    else:
+        # Spans midnight; before midnight the window ends tomorrow
+        if now_time >= start:
+            today += timedelta(days=1)
+        inside = now_time >= start or now_time < end
+    return datetime.combine(today, end, tzinfo=local_now.tzinfo) if inside else None
+
+
+def next_digest(now):
+    """Next REMINDER_DIGEST_INTERVAL boundary; every digest user in an interval is flushed at the same instant"""
+    interval = settings.REMINDER_DIGEST_INTERVAL
+    return now + (interval - (now - EPOCH) % interval)
+
+
+def get_hold_until(student_ids, now):
+    """Until when each of `student_ids` in quiet hours, in class or in digest mode is held back at `now`"""
+    prefs = UserPref.objects.filter(student_id__in=student_ids).filter(
+        Q(quiet_hours_start__isnull=False) | Q(quiet_during_classes=True) | Q(digest_mode=True)
+    ).values_list(
+        'student_id', 'time_zone', 'quiet_hours_start', 'quiet_hours_end', 'quiet_during_classes', 'digest_mode'
+    )
+    if not prefs:
+        return {}
+
+    classes = {}
+    in_class_mode = [student_id for student_id, _, _, _, during_classes, _ in prefs if during_classes]
+    if in_class_mode:
+        for student_id, day_of_week, start, end in CustomClassSchedule.objects.filter(
+            student_id__in=in_class_mode
+        ).values_list('student_id', 'day_of_week', 'scheduled_start_time', 'scheduled_end_time'):
+            classes.setdefault(student_id, []).append((day_of_week, start, end))
+
+    hold_until = {}
+    for student_id, time_zone, quiet_start, quiet_end, during_classes, digest_mode in prefs:
+        local_now = now.astimezone(ZoneInfo(time_zone))
+        ends = []
+        if quiet_start is not None and quiet_end is not None:
+            ends.append(window_end(quiet_start, quiet_end, local_now))
+        if during_classes:
+            weekday = WEEKDAYS[local_now.weekday()]
+            ends += [window_end(start, end, local_now) for day, start, end in classes.get(student_id, []) if day == weekday]
+
+        ends = [end.astimezone(dt_timezone.utc) for end in ends if end is not None]
+        if ends:
+            hold_until[student_id] = max(ends)
+        elif digest_mode:
+            hold_until[student_id] = next_digest(now)
+    return hold_until
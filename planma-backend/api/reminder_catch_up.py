@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from .models import ReminderWatermark
+
+
+def from_timestamp(value):
+    return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+
+
+def sweep_windows(names, now):
+    """When the window each sweep covers this tick starts: where it was last completed, at most REMINDER_CATCH_UP_LIMIT ago"""
+    watermarks = dict(ReminderWatermark.objects.filter(category__in=names).values_list('category', 'swept_until'))
+    oldest = now - settings.REMINDER_CATCH_UP_LIMIT
+
+    windows = {}
+    for name in names:
+        since = watermarks.get(name)
+        if since is None:
+            # Never completed; start with this tick's own minute
+            since = now - timedelta(minutes=1)
+        elif since < oldest:
+            print(f'{name} reminders last swept {since}; those due before {oldest} are expired')
+            since = oldest
+        windows[name] = since
+    return windows
+
+
+def advance_watermarks(names, now):
+    """Record that the sweeps in `names` handled everything due up to `now`"""
+    ReminderWatermark.objects.bulk_create(
+        [ReminderWatermark(category=name, swept_until=now) for name in names],
+        update_conflicts=True, unique_fields=['category'], update_fields=['swept_until']
+    )
+
+
+def is_missed(due_at, now):
+    """Whether a reminder due at `due_at` came due before the minute leading up to `now`, i.e. while no tick ran"""
+    return due_at <= now - timedelta(minutes=1)
+
+
+def is_expired(category, due_at, now):
+    """Whether a reminder of `category` due at `due_at` is dropped: too old, or missed under the 'expire' policy"""
+    if due_at < now - settings.REMINDER_CATCH_UP_LIMIT:
+        return True
+    return settings.REMINDER_CATCH_UP_POLICY[category] == 'expire' and is_missed(due_at, now)
@@ -0,0 +1,77 @@
+from django.conf import settings
+from .presence import get_redis
+
+LEASE_KEY = 'reminders:tick_lease'
+FENCE_KEY = 'reminders:tick_fence'
+PENDING_KEY = 'reminders:tick_pending'
+
+# Counters of ticks that found the lease taken, were folded into a catch-up run, and catch-up runs started
+SKIPPED_KEY = 'reminders:ticks_skipped'
+COALESCED_KEY = 'reminders:ticks_coalesced'
+CATCH_UP_KEY = 'reminders:catch_up_runs'
+
+# Take the lease if it is free, stamping it with the next fencing token
+ACQUIRE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+local token = redis.call('INCR', KEYS[2])
+redis.call('SET', KEYS[1], token, 'EX', ARGV[1])
+return token
+"""
+
+# Delete the lease only if it still carries our token
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def acquire_tick_lease():
+    """Fencing token for a new tick, or None if a tick is still running (this one is then left for catch-up)"""
+    r = get_redis()
+    token = r.register_script(ACQUIRE_SCRIPT)(
+        keys=[LEASE_KEY, FENCE_KEY], args=[settings.REMINDER_TICK_LEASE_TTL]
+    )
+    if token:
+        return token
+
+    pipe = r.pipeline()
+    pipe.incr(PENDING_KEY)
+    pipe.incr(SKIPPED_KEY)
+    pipe.execute()
+    return None
+
+
+def lease_is_current(token):
+    """False once a newer tick has been granted the lease, i.e. `token` belongs to a stale run"""
+    return int(get_redis().get(FENCE_KEY) or 0) == token
+
+
+def release_tick_lease(token):
+    """Release the lease held by `token` and return how many ticks arrived while it was held"""
+    r = get_redis()
+    r.register_script(RELEASE_SCRIPT)(keys=[LEASE_KEY], args=[token])
+
+    pipe = r.pipeline()
+    pipe.get(PENDING_KEY)
+    pipe.delete(PENDING_KEY)
+    pending = int(pipe.execute()[0] or 0)
+
+    if pending:
+        pipe = r.pipeline()
+        pipe.incrby(COALESCED_KEY, pending)
+        pipe.incr(CATCH_UP_KEY)
+        pipe.execute()
+    return pending
+
+
+def lease_counters():
+    skipped, coalesced, catch_up_runs = get_redis().mget(SKIPPED_KEY, COALESCED_KEY, CATCH_UP_KEY)
+    return {
+        'skipped_ticks': int(skipped or 0),
+        'coalesced_ticks': int(coalesced or 0),
+        'catch_up_runs': int(catch_up_runs or 0),
+    }
@@ -0,0 +1,80 @@
+import math
+import redis
+from datetime import timedelta
+from django.utils import timezone
+from .models import ReminderTrigger
+from .presence import get_redis
+
+QUEUE_KEY = 'reminders:due'
+
+# Triggers firing within this horizon are kept in the queue, later ones are picked up by refill_queue()
+QUEUE_HORIZON = timedelta(hours=1)
+
+# Atomically remove and return up to ARGV[2] members scored at or before ARGV[1]
+POP_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+end
+return due
+"""
+
+
+def queue_score(fire_at):
+    # Rounded up so a popped trigger is never still in the future
+    return math.ceil(fire_at.timestamp())
+
+
+def enqueue_triggers(triggers):
+    """Add or move the given triggers, removing those that are fired or fall outside the horizon"""
+    horizon = timezone.now() + QUEUE_HORIZON
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for trigger in triggers:
+            if not trigger.fired and trigger.fire_at <= horizon:
+                pipe.zadd(QUEUE_KEY, {trigger.trigger_id: queue_score(trigger.fire_at)})
+            else:
+                pipe.zrem(QUEUE_KEY, trigger.trigger_id)
+        pipe.execute()
+    except redis.RedisError as e:
+        # The beat sweep still sends these, just on the minute
+        print(f'Error updating reminder queue: {str(e)}')
+
+
+def dequeue_triggers(trigger_ids):
+    if not trigger_ids:
+        return
+    try:
+        get_redis().zrem(QUEUE_KEY, *trigger_ids)
+    except redis.RedisError as e:
+        print(f'Error updating reminder queue: {str(e)}')
+
+
+def refill_queue(now=None):
+    """Load every unfired trigger firing within the horizon into the queue"""
+    now = now or timezone.now()
+    due = ReminderTrigger.objects.filter(
+        fired=False, fire_at__lte=now + QUEUE_HORIZON
+    ).values_list('trigger_id', 'fire_at')
+
+    scores = {trigger_id: queue_score(fire_at) for trigger_id, fire_at in due}
+    if scores:
+        get_redis().zadd(QUEUE_KEY, scores)
+    return len(scores)
+
+
+def pop_due(now=None, limit=500):
+    """Remove and return the ids of up to `limit` triggers that have come due"""
+    now = now or timezone.now()
+    r = get_redis()
+    due = r.register_script(POP_DUE_SCRIPT)(keys=[QUEUE_KEY], args=[math.floor(now.timestamp()), limit])
+    return [int(trigger_id) for trigger_id in due]
+
+
+def seconds_until_next(now=None, max_wait=1.0):
+    """Time to wait before the earliest queued trigger is due, capped so new entries are noticed"""
+    now = now or timezone.now()
+    earliest = get_redis().zrange(QUEUE_KEY, 0, 0, withscores=True)
+    if not earliest:
+        return max_wait
+    return min(max(earliest[0][1] - now.timestamp(), 0), max_wait)
@@ -0,0 +1,212 @@
+import json
+import logging
+import time
+import redis
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from .presence import get_redis, redis_round_trips
+from .reminder_lease import lease_counters
+from .push_tokens import pruned_token_count
+from .push_rate_limit import throttled_counts
+from .models import NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = 'reminders:tick_stats'
+RELAYED_KEY = 'outbox:relayed'
+
+# What happened to the rows each sweep looked at
+SWEEP_COUNTERS = ['scanned', 'due', 'held', 'skipped', 'expired']
+# Summed across ticks alongside the counters
+SWEEP_TOTALS = SWEEP_COUNTERS + ['db_queries', 'redis_round_trips', 'errors']
+# What happened to the outbox messages the notification relay picked up, summed in RELAYED_KEY
+RELAY_COUNTERS = ['messages', 'in_app', 'push', 'skipped', 'throttled', 'retried', 'given_up']
+
+
+def new_sweep_counts():
+    return dict.fromkeys(SWEEP_COUNTERS, 0)
+
+
+def measure_sweep(sweep, *args):
+    """Run a sweep and add its wall time, database queries and Redis round trips to its counts"""
+    queries = 0
+
+    def count_query(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    round_trips = redis_round_trips()
+    started = time.perf_counter()
+    with connection.execute_wrapper(count_query):
+        counts = sweep(*args)
+
+    counts['seconds'] = round(time.perf_counter() - started, 4)
+    counts['db_queries'] = queries
+    counts['redis_round_trips'] = redis_round_trips() - round_trips
+    return counts
+
+
+def merge_shard_counts(shard_counts):
+    """Add up each sweep's counts across shards; shards run in parallel, so seconds is the slowest one's"""
+    sweeps = {}
+    for counts in shard_counts:
+        for name, values in counts.items():
+            total = sweeps.setdefault(name, {})
+            for key, value in values.items():
+                if key == 'seconds':
+                    total[key] = max(total.get(key, 0), value)
+                else:
+                    total[key] = total.get(key, 0) + value
+    return sweeps
+
+
+def record_tick(sweeps, started_at):
+    """Store a finished tick in the rolling window, warning when it ran close to its budget"""
+    seconds = round(time.time() - started_at, 3)
+    tick = {
+        'started_at': timezone.localtime(datetime.fromtimestamp(started_at, tz=dt_timezone.utc)).isoformat(),
+        'seconds': seconds,
+        'sweeps': sweeps,
+    }
+
+    if seconds >= settings.REMINDER_TICK_BUDGET * settings.REMINDER_TICK_WARNING_RATIO:
+        slowest = max(sweeps, key=lambda name: sweeps[name].get('seconds', 0), default=None)
+        logger.warning(
+            'Reminder tick took %ss of its %ss budget; slowest sweep: %s',
+            seconds, settings.REMINDER_TICK_BUDGET, slowest
+        )
+
+    pipe = get_redis().pipeline()
+    pipe.lpush(STATS_KEY, json.dumps(tick))
+    pipe.ltrim(STATS_KEY, 0, settings.REMINDER_STATS_WINDOW - 1)
+    pipe.execute()
+    return tick
+
+
+def record_relay_counts(counts):
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for key, value in counts.items():
+            if value:
+                pipe.hincrby(RELAYED_KEY, key, value)
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f'Could not record notification relay counts: {str(e)}')
+
+
+def outbox_stats():
+    """Messages waiting in the outbox, the due ones per push lane, messages the relay gave up on, and the relay's totals"""
+    relayed = get_redis().hgetall(RELAYED_KEY)
+    due = NotificationOutbox.objects.filter(available_at__lte=timezone.now())
+    urgent = Q(reminder_type__in=settings.PUSH_URGENT_TYPES)
+    return {
+        'pending': NotificationOutbox.objects.filter(available_at__isnull=False).count(),
+        'due': {'urgent': due.filter(urgent).count(), 'normal': due.exclude(urgent).count()},
+        'dead_letters': NotificationOutbox.objects.filter(available_at__isnull=True).count(),
+        **{key: int(relayed.get(key.encode(), 0)) for key in RELAY_COUNTERS},
+    }
+
+
+def recent_ticks(count=None):
+    """Recorded ticks, newest first"""
+    count = count or settings.REMINDER_STATS_WINDOW
+    return [json.loads(tick) for tick in get_redis().lrange(STATS_KEY, 0, count - 1)]
+
+
+def summarize_ticks(ticks):
+    """Per-sweep averages and maxima over `ticks`, and which sweep dominates tick latency"""
+    budget = settings.REMINDER_TICK_BUDGET
+    summary = {
+        'ticks': len(ticks),
+        'budget_seconds': budget,
+        'last_seconds': ticks[0]['seconds'] if ticks else None,
+        'avg_seconds': round(sum(t['seconds'] for t in ticks) / len(ticks), 3) if ticks else None,
+        'max_seconds': max((t['seconds'] for t in ticks), default=None),
+        'near_budget': sum(t['seconds'] >= budget * settings.REMINDER_TICK_WARNING_RATIO for t in ticks),
+        **lease_counters(),
+        'pruned_tokens': pruned_token_count(),
+        'outbox': outbox_stats(),
+        'throttled_pushes': throttled_counts(),
+        'sweeps': {},
+    }
+
+    for tick in ticks:
+        for name, counts in tick['sweeps'].items():
+            sweep = summary['sweeps'].setdefault(name, {'avg_seconds': 0, 'max_seconds': 0})
+            sweep['avg_seconds'] += counts.get('seconds', 0) / len(ticks)
+            sweep['max_seconds'] = max(sweep['max_seconds'], counts.get('seconds', 0))
+            for key in SWEEP_TOTALS:
+                sweep[key] = sweep.get(key, 0) + counts.get(key, 0)
+
+    for sweep in summary['sweeps'].values():
+        sweep['avg_seconds'] = round(sweep['avg_seconds'], 4)
+
+    summary['slowest_sweep'] = max(
+        summary['sweeps'], key=lambda name: summary['sweeps'][name]['avg_seconds'], default=None
+    )
+    return summary
+
+
+def prometheus_text(summary):
+    """Render a summary in the Prometheus text exposition format"""
+    lines = [
+        '# HELP planma_reminder_tick_seconds Reminder tick wall time over the recorded window.',
+        '# TYPE planma_reminder_tick_seconds gauge',
+    ]
+    for stat in ['last', 'avg', 'max']:
+        value = summary[f'{stat}_seconds']
+        if value is not None:
+            lines.append(f'planma_reminder_tick_seconds{{stat="{stat}"}} {value}')
+
+    lines += [
+        '# HELP planma_reminder_tick_budget_seconds Time a reminder tick may take.',
+        '# TYPE planma_reminder_tick_budget_seconds gauge',
+        f"planma_reminder_tick_budget_seconds {summary['budget_seconds']}",
+        '# HELP planma_reminder_ticks_near_budget Recorded ticks that ran close to the budget.',
+        '# TYPE planma_reminder_ticks_near_budget gauge',
+        f"planma_reminder_ticks_near_budget {summary['near_budget']}",
+        '# HELP planma_reminder_ticks_skipped_total Ticks that started while the previous one still held the lease.',
+        '# TYPE planma_reminder_ticks_skipped_total counter',
+        f"planma_reminder_ticks_skipped_total {summary['skipped_ticks']}",
+        '# HELP planma_reminder_ticks_coalesced_total Skipped ticks folded into a catch-up run.',
+        '# TYPE planma_reminder_ticks_coalesced_total counter',
+        f"planma_reminder_ticks_coalesced_total {summary['coalesced_ticks']}",
+        '# HELP planma_reminder_catch_up_runs_total Catch-up runs started after an overrunning tick.',
+        '# TYPE planma_reminder_catch_up_runs_total counter',
+        f"planma_reminder_catch_up_runs_total {summary['catch_up_runs']}",
+        '# HELP planma_push_tokens_pruned_total FCM tokens deleted after FCM permanently rejected them.',
+        '# TYPE planma_push_tokens_pruned_total counter',
+        f"planma_push_tokens_pruned_total {summary['pruned_tokens']}",
+        '# HELP planma_outbox_messages Notifications waiting for the relay, and ones it gave up on.',
+        '# TYPE planma_outbox_messages gauge',
+        f"planma_outbox_messages{{state=\"pending\"}} {summary['outbox']['pending']}",
+        f"planma_outbox_messages{{state=\"dead_letter\"}} {summary['outbox']['dead_letters']}",
+        '# HELP planma_outbox_due_messages Notifications due for delivery, per push lane; the push queue depth.',
+        '# TYPE planma_outbox_due_messages gauge',
+        *[f'planma_outbox_due_messages{{lane="{lane}"}} {count}' for lane, count in summary['outbox']['due'].items()],
+        '# HELP planma_push_throttled_total Pushes held back by the push rate limit, per lane.',
+        '# TYPE planma_push_throttled_total counter',
+        *[f'planma_push_throttled_total{{lane="{lane}"}} {count}' for lane, count in summary['throttled_pushes'].items()],
+        '# HELP planma_outbox_relayed_total Outbox messages by what the relay did with them.',
+        '# TYPE planma_outbox_relayed_total counter',
+        *[f'planma_outbox_relayed_total{{event="{key}"}} {summary["outbox"][key]}' for key in RELAY_COUNTERS],
+        '# HELP planma_reminder_sweep_seconds Sweep wall time over the recorded window.',
+        '# TYPE planma_reminder_sweep_seconds gauge',
+    ]
+    for name, sweep in summary['sweeps'].items():
+        lines.append(f'planma_reminder_sweep_seconds{{sweep="{name}",stat="avg"}} {sweep["avg_seconds"]}')
+        lines.append(f'planma_reminder_sweep_seconds{{sweep="{name}",stat="max"}} {sweep["max_seconds"]}')
+
+    lines += [
+        '# HELP planma_reminder_sweep_events Rows, sends and round trips summed over the recorded window.',
+        '# TYPE planma_reminder_sweep_events gauge',
+    ]
+    for name, sweep in summary['sweeps'].items():
+        for key in SWEEP_TOTALS:
+            lines.append(f'planma_reminder_sweep_events{{sweep="{name}",event="{key}"}} {sweep[key]}')
+
+    return '\n'.join(lines) + '\n'
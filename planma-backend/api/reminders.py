@@ -0,0 +1,177 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
+from .models import (
+    ReminderTrigger, UserPref, CustomTask, CustomEvents, CustomActivity,
+    CustomClassSchedule
+)
+from .reminder_queue import enqueue_triggers, dequeue_triggers
+
+DEFAULT_REMINDER_OFFSET = timedelta(minutes=30)
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def _as_date(value):
+    # Views assign raw request strings to model fields before saving
+    return parse_date(value) if isinstance(value, str) else value
+
+def _as_time(value):
+    return parse_time(value) if isinstance(value, str) else value
+
+def _combine(date, time, zone):
+    return datetime.combine(_as_date(date), _as_time(time), tzinfo=zone)
+
+
+def reminder_offsets(user_pref, category_type):
+    """Offsets before an item's start at which its reminders fire"""
+    offsets = {user_pref.reminder_offset_time if user_pref else DEFAULT_REMINDER_OFFSET}
+    offsets.update(settings.REMINDER_EXTRA_OFFSETS.get(category_type, []))
+    return sorted(offsets, reverse=True)
+
+def user_time_zone(user_pref):
+    """Zone the user's dates and times are in"""
+    return ZoneInfo(user_pref.time_zone if user_pref else settings.TIME_ZONE)
+
+def get_user_pref(student_id):
+    return UserPref.objects.filter(student_id=student_id).first()
+
+def is_muted(user_pref, category_type):
+    return user_pref is not None and user_pref.mutes(category_type)
+
+
+def delete_triggers(triggers):
+    """Delete the given triggers and drop them from the dispatcher's queue"""
+    trigger_ids = list(triggers.values_list('trigger_id', flat=True))
+    triggers.delete()
+    dequeue_triggers(trigger_ids)
+
+
+def schedule_reminders(category_type, reference_id, student_id, starts_at, offsets, channel='auto'):
+    """Create or move the triggers of one item so each fires `offset` before `starts_at`"""
+    triggers = ReminderTrigger.objects.filter(category_type=category_type, reference_id=reference_id)
+
+    # Nothing left to remind about once the item has started
+    if starts_at <= timezone.now():
+        delete_triggers(triggers)
+        return
+
+    delete_triggers(triggers.exclude(offset__in=offsets))
+    existing = {trigger.offset: trigger for trigger in triggers.filter(channel=channel)}
+    changed = []
+
+    for offset in offsets:
+        trigger = existing.get(offset)
+
+        # Keep the fired state of triggers whose fire time did not move
+        if trigger and trigger.starts_at == starts_at:
+            continue
+
+        trigger, _ = ReminderTrigger.objects.update_or_create(
+            category_type=category_type,
+            reference_id=reference_id,
+            offset=offset,
+            channel=channel,
+            defaults={
+                'student_id_id': student_id,
+                'starts_at': starts_at,
+                'fire_at': starts_at - offset,
+                'fired': False,
+            }
+        )
+        changed.append(trigger)
+
+    enqueue_triggers(changed)
+
+
+def clear_reminders(category_type, reference_id):
+    delete_triggers(ReminderTrigger.objects.filter(category_type=category_type, reference_id=reference_id))
+
+
+# Each scheduler takes the owner's preferences when the caller already has them. Muted
+# categories get no triggers, so the reminder sweeps never load them.
+def schedule_task_reminders(task, user_pref=None):
+    user_pref = user_pref or get_user_pref(task.student_id_id)
+    if task.status == 'Completed' or is_muted(user_pref, 'Task'):
+        clear_reminders('Task', task.task_id)
+        return
+
+    schedule_reminders(
+        'Task', task.task_id, task.student_id_id, task.deadline, reminder_offsets(user_pref, 'Task')
+    )
+
+
+def schedule_event_reminders(event, user_pref=None):
+    user_pref = user_pref or get_user_pref(event.student_id_id)
+    if is_muted(user_pref, 'Event'):
+        clear_reminders('Event', event.event_id)
+        return
+
+    starts_at = _combine(event.scheduled_date, event.scheduled_start_time, user_time_zone(user_pref))
+    schedule_reminders(
+        'Event', event.event_id, event.student_id_id, starts_at, reminder_offsets(user_pref, 'Event')
+    )
+
+
+def schedule_activity_reminders(activity, user_pref=None):
+    user_pref = user_pref or get_user_pref(activity.student_id_id)
+    if activity.status == 'Completed' or is_muted(user_pref, 'Activity'):
+        clear_reminders('Activity', activity.activity_id)
+        return
+
+    starts_at = _combine(activity.scheduled_date, activity.scheduled_start_time, user_time_zone(user_pref))
+    schedule_reminders(
+        'Activity', activity.activity_id, activity.student_id_id, starts_at, reminder_offsets(user_pref, 'Activity')
+    )
+
+
+def next_class_start(class_schedule, zone, after=None):
+    """Next start of a weekly class in `zone` strictly after `after` (defaults to now)"""
+    after = after or timezone.now()
+    local_after = after.astimezone(zone)
+    days_ahead = (WEEKDAYS.index(class_schedule.day_of_week) - local_after.weekday()) % 7
+
+    starts_at = _combine(local_after.date() + timedelta(days=days_ahead), class_schedule.scheduled_start_time, zone)
+    if starts_at <= after:
+        starts_at = _combine(local_after.date() + timedelta(days=days_ahead + 7), class_schedule.scheduled_start_time, zone)
+    return starts_at
+
+
+def schedule_class_reminders(class_schedule, user_pref=None):
+    """Arm the triggers of a weekly class for its next occurrence"""
+    user_pref = user_pref or get_user_pref(class_schedule.student_id_id)
+    if class_schedule.day_of_week not in WEEKDAYS or is_muted(user_pref, 'Class'):
+        clear_reminders('Class', class_schedule.classsched_id)
+        return
+
+    schedule_reminders(
+        'Class', class_schedule.classsched_id, class_schedule.student_id_id,
+        next_class_start(class_schedule, user_time_zone(user_pref)), reminder_offsets(user_pref, 'Class')
+    )
+
+
+def rebuild_reminders(student_id=None):
+    """Recompute the triggers of every pending item, optionally for a single student"""
+    owned = {'student_id': student_id} if student_id else {}
+    user_prefs = {
+        pref.student_id_id: pref
+        for pref in UserPref.objects.filter(**owned)
+    }
+    now = timezone.now()
+
+    # A day back covers the users whose date is still behind the server's
+    since = timezone.localdate(now) - timedelta(days=1)
+
+    for task in CustomTask.objects.filter(status__in=['Pending', 'In Progress'], deadline__gt=now, **owned):
+        schedule_task_reminders(task, user_prefs.get(task.student_id_id))
+
+    for event in CustomEvents.objects.filter(scheduled_date__gte=since, **owned):
+        schedule_event_reminders(event, user_prefs.get(event.student_id_id))
+
+    for activity in CustomActivity.objects.filter(status__in=['Pending', 'In Progress'], scheduled_date__gte=since, **owned):
+        schedule_activity_reminders(activity, user_prefs.get(activity.student_id_id))
+
+    for class_schedule in CustomClassSchedule.objects.filter(**owned):
+        schedule_class_reminders(class_schedule, user_prefs.get(class_schedule.student_id_id))
@@ -1,3 +1,4 @@
+from zoneinfo import available_timezones
 from rest_framework import serializers
 from .models import *
 from djoser.serializers import UserCreateSerializer, UserSerializer
@@ -75,8 +76,23 @@ class UserPrefSerializer(serializers.ModelSerializer):
     class Meta: 
         model = UserPref
         fields = ['pref_id', 'usual_sleep_time', 'usual_wake_time', 
-                  'reminder_offset_time', 'student_id']
+                  'reminder_offset_time', 'time_zone', 'quiet_hours_start', 'quiet_hours_end',
+                  'quiet_during_classes', 'digest_mode', 'mute_task_reminders', 'mute_event_reminders',
+                  'mute_activity_reminders', 'mute_class_reminders', 'mute_goal_reminders',
+                  'mute_sleep_reminders', 'mute_wake_reminders', 'mute_push', 'mute_in_app', 'student_id']
         read_only_fields = ['student_id']
+
+    def validate(self, data):
+        start = data.get('quiet_hours_start', getattr(self.instance, 'quiet_hours_start', None))
+        end = data.get('quiet_hours_end', getattr(self.instance, 'quiet_hours_end', None))
+        if (start is None) != (end is None):
+            raise serializers.ValidationError("Quiet hours need both a start and an end.")
+        return data
+
+    def validate_time_zone(self, value):
+        if value not in available_timezones():
+            raise serializers.ValidationError(f"Unknown time zone: {value}")
+        return value
         
 class CustomSemesterSerializer(serializers.ModelSerializer):
     student_id = serializers.PrimaryKeyRelatedField(queryset=CustomUser.objects.all())
@@ -221,4 +237,11 @@ class ScheduleEntrySerializer(serializers.ModelSerializer):
 class FCMTokenSerializer(serializers.ModelSerializer):
     class Meta:
         model = FCMToken
-        fields = ['token']
\ No newline at end of file
+        fields = ['id', 'token', 'last_seen']
+        read_only_fields = ['last_seen']
+
+
+class FCMTokenRegisterSerializer(FCMTokenSerializer):
+    class Meta(FCMTokenSerializer.Meta):
+        # Registering a token already on file moves it to the caller instead of failing
+        extra_kwargs = {'token': {'validators': []}}
\ No newline at end of file
@@ -1,354 +1,478 @@
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
 from django.utils import timezone
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Exists, OuterRef
 from datetime import timedelta
-from celery import shared_task
-from firebase_admin import messaging
+from functools import partial
+from zoneinfo import ZoneInfo
+import time
 import redis
-import json
+from celery import shared_task, chord
+from firebase_admin import messaging
+from . import fcm_client
+from .push_tokens import get_tokens, classify_send_error, prune_tokens, delete_tokens, DEAD_TOKEN_STATUSES
+from .push_rate_limit import acquire_push_quota, LANES
+from .reminder_stats import new_sweep_counts, measure_sweep, merge_shard_counts, record_tick
+from .reminder_lease import acquire_tick_lease, lease_is_current, release_tick_lease
+from .quiet_hours import get_hold_until
+from .reminders import WEEKDAYS, next_class_start
+from .reminder_catch_up import (
+    from_timestamp, sweep_windows, advance_watermarks, is_expired
+)
 from .models import (
     CustomEvents, UserPref, CustomTask, CustomClassSchedule, CustomActivity,
-    Goals, GoalSchedule, CustomUser, FCMToken
+    Goals, GoalSchedule, CustomUser, FCMToken, ReminderTrigger, NotificationOutbox, REMINDER_BUCKETS, WAKE_UP_REMINDER_LEAD,
+    MUTED_EVERYWHERE, next_daily_instant
 )
 
-def is_user_in_foreground(user_id):
-    r = redis.Redis()
-    key = f"user_online:{user_id}"
-    if not r.exists(key):
-        return False
-    try:
-        data = json.loads(r.get(key))
-        return data.get("foreground", False)
-    except:
-        return False
-
-# In-App Reminders
-def send_sleep_reminders():
-    """Check for sleep reminders and send notifications"""
-
-    now = timezone.now()
-    today = now.date()
-
-    # Get all user preferences
-    user_prefs = UserPref.objects.filter(
-        student_id__is_active=True
-    ).select_related('student_id')
-
-    channel_layer = get_channel_layer()
-
-    for pref in user_prefs:
-        # Skip if reminder was already sent today
-        if pref.last_sleep_reminder_date == today:
+# Reminder Delivery
+class ReminderDispatch:
+    """Collects the reminders found by a shard's sweeps and writes them to the notification outbox.
+
+    claim_rows has each chunk's reminders written in the transaction that claims
+    them, so a claimed reminder is always either in the outbox or unclaimed again.
+    The relay then sends everything due for one user as a single message. Each
+    sweep gets its own counts.
+    """
+
+    def __init__(self):
+        # One timestamp for the whole tick, so the relay takes each user's reminders together
+        self.available_at = timezone.now()
+        self.pending = []
+        self.counts = new_sweep_counts()
+        # Users (scanned) and reminders (due) written to the outbox across sweeps
+        self.written = new_sweep_counts()
+
+    def start_sweep(self):
+        """Counts for the reminders delivered from here on, i.e. by the next sweep"""
+        self.counts = new_sweep_counts()
+        return self.counts
+
+    def deliver(self, student_id, reminder_type, reminder, title, body, channel='auto', starts_at=None):
+        """Queue a reminder for the user; the relay sends it in-app if the user is in the foreground, by push otherwise.
+
+        `starts_at` is when the item the reminder is about begins; it is never held back past it.
+        """
+        self.counts['due'] += 1
+        self.pending.append((NotificationOutbox(
+            student_id_id=student_id, channel=channel, reminder_type=reminder_type,
+            payload={'reminder': reminder, 'title': title, 'body': body}, available_at=self.available_at
+        ), starts_at))
+
+    def skip(self):
+        self.counts['skipped'] += 1
+
+    def expire(self):
+        """Count a reminder dropped because it is too late to be of use"""
+        self.counts['expired'] += 1
+
+    def write(self):
+        """Add the queued reminders to the outbox, in the caller's transaction.
+
+        Non-urgent reminders of users in quiet hours, in class or in digest mode
+        are made available to the relay only once that ends. A user's held
+        reminders then come due together and go out as one message.
+        """
+        holdable = {
+            message.student_id_id for message, _ in self.pending
+            if message.reminder_type in settings.REMINDER_HOLD_TYPES
+        }
+        hold_until = get_hold_until(holdable, self.available_at) if holdable else {}
+
+        for message, starts_at in self.pending:
+            release = hold_until.get(message.student_id_id)
+            if release and message.reminder_type in settings.REMINDER_HOLD_TYPES and (
+                starts_at is None or starts_at > release
+            ):
+                message.available_at = release
+                self.counts['held'] += 1
+
+        NotificationOutbox.objects.bulk_create([message for message, _ in self.pending])
+        self.written['scanned'] += len({message.student_id_id for message, _ in self.pending})
+        self.written['due'] += len(self.pending)
+        self.pending = []
+
+
+def shard_filter(shard, shard_count):
+    """Lookups limiting a sweep to the users whose reminder_bucket falls in `shard` of `shard_count`"""
+    return {
+        'student_id__reminder_bucket__gte': shard * REMINDER_BUCKETS // shard_count,
+        'student_id__reminder_bucket__lt': (shard + 1) * REMINDER_BUCKETS // shard_count,
+    }
+
+
+def claim_rows(queryset, record, dispatch, reschedule=None, **changes):
+    """Claim the due rows of `queryset` a chunk at a time, yielding each chunk as `record`s.
+
+    Each chunk is locked and marked with `changes` in one UPDATE (or passed to
+    `reschedule` when each row moves differently). The transaction stays open
+    while the sweep queues the chunk's reminders on `dispatch`, and commits with
+    them written to the outbox; a sweep that fails mid-chunk rolls its claim back.
+    Marked rows no longer match `queryset`, so the next chunk picks up where the
+    last one ended. Rows already locked by an overlapping tick or another worker
+    are skipped, so every reminder is claimed, and therefore sent, exactly once.
+    Only the record's columns are read, so a sweep holds at most one chunk however
+    many rows are due.
+    """
+    while True:
+        with transaction.atomic():
+            rows = list(
+                queryset.select_for_update(skip_locked=True, of=('self',))
+                .values_list(*record.__slots__)[:settings.REMINDER_CHUNK_SIZE]
+            )
+            records = [record(*row) for row in rows]
+            if reschedule:
+                reschedule(records)
+            else:
+                queryset.model.objects.filter(pk__in=[row[0] for row in rows]).update(**changes)
+
+            counts = dict(dispatch.counts)
+            try:
+                yield records
+            except BaseException:
+                # The claim rolls back, so neither the chunk's reminders nor its counts may outlive it
+                dispatch.pending = []
+                dispatch.counts.update(counts)
+                raise
+            dispatch.write()
+        if len(rows) < settings.REMINDER_CHUNK_SIZE:
+            return
+
+
+# Candidate Records
+class Candidate:
+    """The columns of a due row a sweep needs; __slots__ names them, primary key first"""
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+
+class DueTrigger(Candidate):
+    __slots__ = ('trigger_id', 'category_type', 'reference_id', 'student_id', 'starts_at', 'fire_at', 'offset', 'channel')
+
+
+class DueSleepPref(Candidate):
+    __slots__ = (
+        'pref_id', 'student_id', 'usual_sleep_time', 'reminder_offset_time', 'time_zone', 'next_sleep_reminder_at'
+    )
+
+
+class DueWakePref(Candidate):
+    __slots__ = ('pref_id', 'student_id', 'usual_wake_time', 'time_zone', 'next_wake_reminder_at')
+
+
+class DueGoal(Candidate):
+    __slots__ = ('goal_id', 'student_id', 'goal_name', 'goal_desc', 'goal_type', 'target_hours', 'timeframe')
+
+
+# Item Reminders
+def build_task_reminder(task, now):
+    subject_name = task.subject_id.subject_title if task.subject_id else "No subject"
+    time_remaining = task.deadline - now
+    hours_remaining = round(time_remaining.total_seconds() / 3600, 1)
+
+    reminder_data = {
+        'id': task.task_id,
+        'name': task.task_name,
+        'description': task.task_desc,
+        'deadline': task.deadline.isoformat(),
+        'subject': subject_name,
+        'hours_remaining': hours_remaining
+    }
+    body = f"{task.task_name} is due soon! Subject: {subject_name}"
+    return reminder_data, "Task Reminder", body
+
+def build_event_reminder(event, now):
+    reminder_data = {
+        'id': event.event_id,
+        'name': event.event_name,
+        'description': event.event_desc,
+        'location': event.location,
+        'scheduled_date': event.scheduled_date.isoformat(),
+        'start_time': event.scheduled_start_time.isoformat(),
+        'end_time': event.scheduled_end_time.isoformat(),
+        'event_type': event.event_type
+    }
+    body = f"{event.event_name} starts soon at {event.scheduled_start_time.strftime('%I:%M %p')}."
+    return reminder_data, "Event Reminder", body
+
+def build_activity_reminder(activity, now):
+    reminder_data = {
+        'id': activity.activity_id,
+        'name': activity.activity_name,
+        'description': activity.activity_desc,
+        'scheduled_date': activity.scheduled_date.isoformat(),
+        'start_time': activity.scheduled_start_time.isoformat(),
+        'end_time': activity.scheduled_end_time.isoformat(),
+        'status': activity.status
+    }
+    body = f"{activity.activity_name} starts at {activity.scheduled_start_time.strftime('%I:%M %p')}."
+    return reminder_data, "Activity Reminder", body
+
+def build_class_reminder(class_schedule, now):
+    reminder_data = {
+        'id': class_schedule.classsched_id,
+        'subject_code': class_schedule.subject.subject_code,
+        'subject_title': class_schedule.subject.subject_title,
+        'room': class_schedule.room,
+        'start_time': class_schedule.scheduled_start_time.isoformat(),
+        'end_time': class_schedule.scheduled_end_time.isoformat()
+    }
+    body = f"Your class in {class_schedule.subject.subject_code} starts at {class_schedule.scheduled_start_time.strftime('%I:%M %p')} in {class_schedule.room}."
+    return reminder_data, "Class Reminder", body
+
+# category_type -> (item queryset, reminder_type sent to the app, payload builder);
+# the querysets read only the columns their builder uses
+REMINDER_SOURCES = {
+    'Task': (
+        CustomTask.objects.select_related('subject_id').only(
+            'task_name', 'task_desc', 'deadline', 'subject_id__subject_title'
+        ),
+        'task', build_task_reminder
+    ),
+    'Event': (
+        CustomEvents.objects.only(
+            'event_name', 'event_desc', 'location', 'scheduled_date',
+            'scheduled_start_time', 'scheduled_end_time', 'event_type'
+        ),
+        'event', build_event_reminder
+    ),
+    'Activity': (
+        CustomActivity.objects.only(
+            'activity_name', 'activity_desc', 'scheduled_date',
+            'scheduled_start_time', 'scheduled_end_time', 'status'
+        ),
+        'activity', build_activity_reminder
+    ),
+    'Class': (
+        CustomClassSchedule.objects.select_related('subject').only(
+            'room', 'scheduled_start_time', 'scheduled_end_time',
+            'subject__subject_code', 'subject__subject_title'
+        ),
+        'class', build_class_reminder
+    ),
+}
+
+def reschedule_triggers(triggers, now):
+    """Mark the claimed triggers fired, re-arming weekly class triggers for the class's next start instead.
+
+    The next start is computed in the owner's time zone, so a class keeps its wall-clock
+    time across DST changes.
+    """
+    class_triggers = [trigger for trigger in triggers if trigger.category_type == 'Class']
+    classes = CustomClassSchedule.objects.only(
+        'day_of_week', 'scheduled_start_time'
+    ).in_bulk({trigger.reference_id for trigger in class_triggers})
+    time_zones = dict(UserPref.objects.filter(
+        student_id__in={trigger.student_id for trigger in class_triggers}
+    ).values_list('student_id', 'time_zone'))
+
+    rearmed = []
+    for trigger in class_triggers:
+        class_schedule = classes.get(trigger.reference_id)
+        # A deleted class's trigger is fired, and removed by the sweep
+        if class_schedule is None or class_schedule.day_of_week not in WEEKDAYS:
             continue
+        zone = ZoneInfo(time_zones.get(trigger.student_id, settings.TIME_ZONE))
+        starts_at = next_class_start(class_schedule, zone, after=max(trigger.starts_at, now))
+        rearmed.append(ReminderTrigger(
+            trigger_id=trigger.trigger_id, starts_at=starts_at, fire_at=starts_at - trigger.offset
+        ))
+
+    ReminderTrigger.objects.bulk_update(rearmed, ['starts_at', 'fire_at'])
+    rearmed_ids = {trigger.trigger_id for trigger in rearmed}
+    ReminderTrigger.objects.filter(
+        trigger_id__in=[trigger.trigger_id for trigger in triggers if trigger.trigger_id not in rearmed_ids]
+    ).update(fired=True)
+
+def send_due_triggers(triggers, now, dispatch):
+    """Claim the unfired triggers among `triggers` that are due at `now` and queue their reminders on `dispatch`.
+
+    Triggers that came due before the last minute were missed and are handled by the catch-up policy.
+    """
+    counts = dispatch.start_sweep()
+
+    for due_triggers in claim_rows(
+        triggers.filter(fired=False, fire_at__lte=now), DueTrigger, dispatch,
+        reschedule=partial(reschedule_triggers, now=now)
+    ):
+        counts['scanned'] += len(due_triggers)
+
+        # Load the items behind the due triggers, one query per category
+        items = {}
+        for category_type, (queryset, _, _) in REMINDER_SOURCES.items():
+            reference_ids = {t.reference_id for t in due_triggers if t.category_type == category_type}
+            items[category_type] = queryset.in_bulk(reference_ids) if reference_ids else {}
+
+        orphaned_ids = set()
+        for trigger in due_triggers:
+            _, reminder_type, build_reminder = REMINDER_SOURCES[trigger.category_type]
+            item = items[trigger.category_type].get(trigger.reference_id)
+
+            # The item was deleted without going through its model's delete()
+            if item is None:
+                orphaned_ids.add(trigger.trigger_id)
+                dispatch.skip()
+                continue
+
+            # Reminders that come due after the item has started are dropped
+            if now >= trigger.starts_at or is_expired('trigger', trigger.fire_at, now):
+                dispatch.expire()
+                continue
+
+            reminder_data, title, body = build_reminder(item, now)
+            dispatch.deliver(
+                trigger.student_id, reminder_type, reminder_data, title, body, trigger.channel, trigger.starts_at
+            )
 
-        # Create datetime objects for sleep and wake times today
-        sleep_time = timezone.make_aware(
-            timezone.datetime.combine(today, pref.usual_sleep_time)
+        if orphaned_ids:
+            ReminderTrigger.objects.filter(trigger_id__in=orphaned_ids).delete()
+
+    return counts
+
+def send_trigger_reminders(dispatch, since, now, shard=0, shard_count=1):
+    """Send every task, event, activity and class reminder of the shard whose trigger has come due"""
+    # Single range scan over the partial index on unfired triggers; catches anything
+    # the reminder dispatcher missed
+    return send_due_triggers(
+        ReminderTrigger.objects.filter(**shard_filter(shard, shard_count)), now, dispatch
+    )
+
+
+# Due Reminder Queries
+def get_due_sleep_prefs(now):
+    """Unmuted preferences whose next sleep reminder is due by `now`, looked up by its indexed instant"""
+    return UserPref.objects.filter(
+        student_id__is_active=True, next_sleep_reminder_at__lte=now, mute_sleep_reminders=False
+    ).exclude(MUTED_EVERYWHERE)
+
+def get_due_wake_prefs(now):
+    """Unmuted preferences whose next wake-up reminder is due by `now`, looked up by its indexed instant"""
+    return UserPref.objects.filter(
+        student_id__is_active=True, next_wake_reminder_at__lte=now, mute_wake_reminders=False
+    ).exclude(MUTED_EVERYWHERE)
+
+def reschedule_sleep_reminders(prefs, now):
+    """Move the sleep reminder of each claimed preference to its next day"""
+    UserPref.objects.bulk_update([
+        UserPref(
+            pref_id=pref.pref_id,
+            next_sleep_reminder_at=next_daily_instant(
+                pref.usual_sleep_time, pref.reminder_offset_time, pref.time_zone, now
+            ),
+            last_sleep_reminder_date=pref.next_sleep_reminder_at.astimezone(ZoneInfo(pref.time_zone)).date(),
         )
+        for pref in prefs
+    ], ['next_sleep_reminder_at', 'last_sleep_reminder_date'])
+
+def reschedule_wake_reminders(prefs, now):
+    """Move the wake-up reminder of each claimed preference to its next day"""
+    UserPref.objects.bulk_update([
+        UserPref(
+            pref_id=pref.pref_id,
+            next_wake_reminder_at=next_daily_instant(
+                pref.usual_wake_time, WAKE_UP_REMINDER_LEAD, pref.time_zone, now
+            ),
+        )
+        for pref in prefs
+    ], ['next_wake_reminder_at'])
+
+def get_reminder_time_zones():
+    """Every time zone users are in; users without preferences are in the default one"""
+    return set(UserPref.objects.values_list('time_zone', flat=True).distinct()) | {settings.TIME_ZONE}
+
+def in_time_zone(time_zone):
+    """Rows owned by users in `time_zone`"""
+    prefs = UserPref.objects.filter(student_id=OuterRef('student_id'))
+    if time_zone == settings.TIME_ZONE:
+        return ~Exists(prefs.exclude(time_zone=time_zone))
+    return Exists(prefs.filter(time_zone=time_zone))
+
+def get_due_goals(today, time_zone):
+    """Unmuted goals of users in `time_zone` due for `today`'s nudge that have pending sessions that day"""
+    timeframes = ['Daily']
+    if today.weekday() == 0:  # Weekly goals on Mondays
+        timeframes.append('Weekly')
+    if today.day == 1:  # Monthly goals on the first day of the month
+        timeframes.append('Monthly')
+
+    sessions_today = GoalSchedule.objects.filter(scheduled_date=today, status='Pending')
+
+    muted = UserPref.objects.filter(
+        Q(mute_goal_reminders=True) | MUTED_EVERYWHERE, student_id=OuterRef('student_id')
+    )
+
+    return Goals.objects.filter(
+        Q(last_reminder_date__isnull=True) | Q(last_reminder_date__lt=today),
+        in_time_zone(time_zone),
+        student_id__is_active=True,
+        timeframe__in=timeframes,
+    ).filter(
+        Exists(sessions_today.filter(goal_id=OuterRef('pk')))
+    ).exclude(
+        Exists(muted)
+    )
+
+def get_sessions_today(goal_ids, today):
+    """`today`'s pending sessions of each of `goal_ids`, as they appear in the goal reminder"""
+    sessions = {}
+    for goal_id, session_id, start_time, end_time in GoalSchedule.objects.filter(
+        goal_id__in=goal_ids, scheduled_date=today, status='Pending'
+    ).values_list('goal_id', 'goalschedule_id', 'scheduled_start_time', 'scheduled_end_time'):
+        sessions.setdefault(goal_id, []).append({
+            'id': session_id,
+            'start_time': start_time.isoformat(),
+            'end_time': end_time.isoformat()
+        })
+    return sessions
+
+
+# Daily Reminders
+def send_sleep_reminders(dispatch, since, now, shard=0, shard_count=1):
+    """Check for sleep reminders due by `now` and send notifications"""
+    counts = dispatch.start_sweep()
+
+    for due_prefs in claim_rows(
+        get_due_sleep_prefs(now).filter(**shard_filter(shard, shard_count)),
+        DueSleepPref, dispatch, reschedule=partial(reschedule_sleep_reminders, now=now)
+    ):
+        counts['scanned'] += len(due_prefs)
+
+        for pref in due_prefs:
+            if is_expired('sleep', pref.next_sleep_reminder_at, now):
+                dispatch.expire()
+                continue
 
-        # Calculate when reminder should be sent (30 minutes before sleep time)
-        reminder_offset = pref.reminder_offset_time or timedelta(minutes=30)
-        reminder_time = sleep_time - reminder_offset
-
-        # If it's time to send the reminder
-        if now >= reminder_time and now <= sleep_time:
-            student_id = pref.student_id.student_id
             # Format the sleep time nicely
-            formatted_sleep_time = sleep_time.strftime('%I:%M %p')
-
-            # Send to user's channel group
-            if is_user_in_foreground(student_id):
-                async_to_sync(channel_layer.group_send)(
-                    f'user_{pref.student_id.student_id}',
-                    {
-                        'type': 'reminder_notification',
-                        'reminder_type': 'sleep',
-                        'reminder': f"Time to prepare for bed - you should be asleep by {formatted_sleep_time}"
-                    }
-                )
-                # Update last reminder date
-                pref.last_sleep_reminder_date = today
-                pref.save()
-
-def send_task_reminders():
-    """Check for task reminders and send notifications"""
-    now = timezone.now()
-
-    # Get tasks that are due soon but haven't had reminders sent
-    upcoming_tasks = CustomTask.objects.filter(
-        reminder_sent=False,
-        status__in=['Pending', 'In Progress'],
-        deadline__gt=now,  # Hasn't passed yet
-    ).select_related('student_id', 'subject_id')
-
-    channel_layer = get_channel_layer()
-
-    print('Channel Check')
-    print(now)
-    for task in upcoming_tasks:
-        # Get user preferences for reminder timing
-        try:
-            user_pref = UserPref.objects.get(student_id=task.student_id)
-            reminder_offset = user_pref.reminder_offset_time
-        except UserPref.DoesNotExist:
-            # Default to 30 minutes if no preference set
-            reminder_offset = timedelta(minutes=30)
-
-        # Calculate when reminder should be sent
-        reminder_time = task.deadline - reminder_offset
-
-        # print('Time Check')
-        # print(now) 
-        # print(reminder_time) 
-        # If it's time to send the reminder
-        if now >= reminder_time:
-            student_id = task.student_id.student_id
-            # Prepare reminder data
-            subject_name = task.subject_id.subject_title if task.subject_id else "No subject"
-            time_remaining = task.deadline - now
-            hours_remaining = round(time_remaining.total_seconds() / 3600, 1)
-
-            reminder_data = {
-                'id': task.task_id,
-                'name': task.task_name,
-                'description': task.task_desc,
-                'deadline': task.deadline.isoformat(),
-                'subject': subject_name,
-                'hours_remaining': hours_remaining
-            }
-
-            # Send to user's channel group
-            if is_user_in_foreground(student_id):
-                async_to_sync(channel_layer.group_send)(
-                    f'user_{task.student_id.student_id}',
-                    {
-                        'type': 'reminder_notification',
-                        'reminder_type': 'task',
-                        'reminder': reminder_data
-                    }
-                )
-                # Mark as sent
-                task.reminder_sent = True
-                task.save()
+            formatted_sleep_time = pref.usual_sleep_time.strftime('%I:%M %p')
 
-def send_event_reminders():
-    """Check for event reminders and send notifications"""
-    now = timezone.now()
-    today = now.date()
+            dispatch.deliver(
+                pref.student_id, 'sleep',
+                f"Time to prepare for bed - you should be asleep by {formatted_sleep_time}",
+                "Sleep Reminder", f"You should be asleep by {formatted_sleep_time}."
+            )
 
-    # Get events scheduled for today that haven't had reminders sent
-    upcoming_events = CustomEvents.objects.filter(
-        reminder_sent=False,
-        scheduled_date__gte=today,  # Today or in the future
-    ).select_related('student_id')
+    return counts
 
-    channel_layer = get_channel_layer()
+def send_goal_reminders(dispatch, since, now, shard=0, shard_count=1):
+    """Check for goal progress reminders and send notifications"""
+    # Goals are due all day until reminded, so a missed tick is caught up without a window
+    counts = dispatch.start_sweep()
 
-    for event in upcoming_events:
-        # Get user preferences for reminder timing
-        try:
-            user_pref = UserPref.objects.get(student_id=event.student_id)
-            reminder_offset = user_pref.reminder_offset_time
-        except UserPref.DoesNotExist:
-            # Default to 30 minutes if no preference set
-            reminder_offset = timedelta(minutes=30)
-        
-        # Create a datetime object for the event
-        event_datetime = timezone.make_aware(
-            timezone.datetime.combine(event.scheduled_date, event.scheduled_start_time)
-        )
-        
-        # Calculate when reminder should be sent
-        reminder_time = event_datetime - reminder_offset
-        
-        # If it's time to send the reminder (and event hasn't started yet)
-        if now >= reminder_time and now < event_datetime:
-            student_id = event.student_id.student_id
-            # Prepare reminder data
-            reminder_data = {
-                'id': event.event_id,
-                'name': event.event_name,
-                'description': event.event_desc,
-                'location': event.location,
-                'scheduled_date': event.scheduled_date.isoformat(),
-                'start_time': event.scheduled_start_time.isoformat(),
-                'end_time': event.scheduled_end_time.isoformat(),
-                'event_type': event.event_type
-            }
-            
-            # Send to user's channel group
-            if is_user_in_foreground(student_id):
-                async_to_sync(channel_layer.group_send)(
-                    f'user_{event.student_id.student_id}',
-                    {
-                        'type': 'reminder_notification',
-                        'reminder_type': 'event',
-                        'reminder': reminder_data
-                    }
-                )
-            
-                # Mark as sent
-                event.reminder_sent = True
-                event.save()
-        
-def send_class_reminders():
-    """Check for class reminders and send notifications"""
-    now = timezone.now()
-    today = now.date()
-    current_day = today.strftime("%A")  # Get the day name (e.g., "Monday")
-    
-    # Get class schedules for today that haven't had reminders sent today
-    class_schedules = CustomClassSchedule.objects.filter(
-        day_of_week=current_day,
-        last_reminder_date__lt=today  # No reminder sent today
-    ).select_related('student_id', 'subject')
-    
-    channel_layer = get_channel_layer()
-    
-    for class_schedule in class_schedules:
-        # Get user preferences for reminder timing
-        try:
-            user_pref = UserPref.objects.get(student_id=class_schedule.student_id)
-            reminder_offset = user_pref.reminder_offset_time
-        except UserPref.DoesNotExist:
-            # Default to 30 minutes if no preference set
-            reminder_offset = timedelta(minutes=30)
-        
-        # Create a datetime object for the class
-        class_datetime = timezone.make_aware(
-            timezone.datetime.combine(today, class_schedule.scheduled_start_time)
-        )
-        
-        # Calculate when reminder should be sent
-        reminder_time = class_datetime - reminder_offset
-        
-        # If it's time to send the reminder (and class hasn't started yet)
-        if now >= reminder_time and now < class_datetime:
-            student_id = class_schedule.student_id.student_id
-            # Prepare reminder data
-            reminder_data = {
-                'id': class_schedule.classsched_id,
-                'subject_code': class_schedule.subject.subject_code,
-                'subject_title': class_schedule.subject.subject_title,
-                'room': class_schedule.room,
-                'start_time': class_schedule.scheduled_start_time.isoformat(),
-                'end_time': class_schedule.scheduled_end_time.isoformat()
-            }
-            
-            # Send to user's channel group
-            if is_user_in_foreground(student_id):
-                async_to_sync(channel_layer.group_send)(
-                    f'user_{class_schedule.student_id.student_id}',
-                    {
-                        'type': 'reminder_notification',
-                        'reminder_type': 'class',
-                        'reminder': reminder_data
-                    }
-                )
-            
-                # Update last reminder date
-                class_schedule.last_reminder_date = today
-                class_schedule.save()
-
-def send_activity_reminders():
-    """Check for activity reminders and send notifications"""
-    now = timezone.now()
-    today = now.date()
-    
-    # Get activities scheduled for today that haven't had reminders sent
-    upcoming_activities = CustomActivity.objects.filter(
-        reminder_sent=False,
-        status__in=['Pending', 'In Progress'],
-        scheduled_date__gte=today,  # Today or in the future
-    ).select_related('student_id')
-    
-    channel_layer = get_channel_layer()
-    
-    for activity in upcoming_activities:
-        # Get user preferences for reminder timing
-        try:
-            user_pref = UserPref.objects.get(student_id=activity.student_id)
-            reminder_offset = user_pref.reminder_offset_time
-        except UserPref.DoesNotExist:
-            # Default to 30 minutes if no preference set
-            reminder_offset = timedelta(minutes=30)
-        
-        # Create a datetime object for the activity
-        activity_datetime = timezone.make_aware(
-            timezone.datetime.combine(activity.scheduled_date, activity.scheduled_start_time)
-        )
-        
-        # Calculate when reminder should be sent
-        reminder_time = activity_datetime - reminder_offset
-        
-        # If it's time to send the reminder (and activity hasn't started yet)
-        if now >= reminder_time and now < activity_datetime:
-            student_id = activity.student_id.student_id
-            # Prepare reminder data
-            reminder_data = {
-                'id': activity.activity_id,
-                'name': activity.activity_name,
-                'description': activity.activity_desc,
-                'scheduled_date': activity.scheduled_date.isoformat(),
-                'start_time': activity.scheduled_start_time.isoformat(),
-                'end_time': activity.scheduled_end_time.isoformat(),
-                'status': activity.status
-            }
-            
-            # Send to user's channel group
-            if is_user_in_foreground(student_id):
-                async_to_sync(channel_layer.group_send)(
-                    f'user_{activity.student_id.student_id}',
-                    {
-                        'type': 'reminder_notification',
-                        'reminder_type': 'activity',
-                        'reminder': reminder_data
-                    }
-                )
+    # "Today" is each user's own date
+    for time_zone in get_reminder_time_zones():
+        today = timezone.localdate(now, ZoneInfo(time_zone))
 
-                # Mark as sent
-                activity.reminder_sent = True
-                activity.save()                       
+        for due_goals in claim_rows(
+            get_due_goals(today, time_zone).filter(**shard_filter(shard, shard_count)),
+            DueGoal, dispatch, last_reminder_date=today
+        ):
+            counts['scanned'] += len(due_goals)
+            sessions_today = get_sessions_today([goal.goal_id for goal in due_goals], today)
 
-def send_goal_reminders():
-    """Check for goal progress reminders and send notifications"""
-    now = timezone.now()
-    today = now.date()
-    
-    # Get all active goals that haven't had reminders sent today
-    active_goals = Goals.objects.filter(
-        student_id__is_active=True,
-        last_reminder_date__lt=today  # No reminder sent today
-    ).select_related('student_id')
-    
-    channel_layer = get_channel_layer()
-    
-    for goal in active_goals:
-        # Check if it's time to send a reminder based on timeframe
-        send_reminder = False
-        
-        if goal.timeframe == 'Daily':
-            # Send daily reminder
-            send_reminder = True
-        elif goal.timeframe == 'Weekly' and today.weekday() == 0:  # Monday
-            # Send weekly reminder on Mondays
-            send_reminder = True
-        elif goal.timeframe == 'Monthly' and today.day == 1:  # First day of month
-            # Send monthly reminder on first day of month
-            send_reminder = True
-            
-        if send_reminder:
-            # Get scheduled goal sessions for today
-            today_goal_schedules = GoalSchedule.objects.filter(
-                goal_id=goal,
-                scheduled_date=today,
-                status='Pending'
-            )
-            
-            # If there are scheduled sessions today, remind the user
-            if today_goal_schedules.exists():
-                student_id = goal.student_id.student_id
+            for goal in due_goals:
                 # Prepare reminder data
                 reminder_data = {
                     'id': goal.goal_id,
@@ -357,397 +481,276 @@ def send_goal_reminders():
                     'type': goal.goal_type,
                     'target_hours': goal.target_hours,
                     'timeframe': goal.timeframe,
-                    'sessions_today': [
-                        {
-                            'id': sched.goalschedule_id,
-                            'start_time': sched.scheduled_start_time.isoformat(),
-                            'end_time': sched.scheduled_end_time.isoformat()
-                        } for sched in today_goal_schedules
-                    ]
+                    'sessions_today': sessions_today.get(goal.goal_id, [])
                 }
-                
-                # Send to user's channel group
-                if is_user_in_foreground(student_id):
-                    async_to_sync(channel_layer.group_send)(
-                        f'user_{goal.student_id.student_id}',
-                        {
-                            'type': 'reminder_notification',
-                            'reminder_type': 'goal',
-                            'reminder': reminder_data
-                        }
-                    )
-                
-                    # Update last reminder date
-                    goal.last_reminder_date = today
-                    goal.save()
-
-def send_wake_up_reminders():
-    """Check and send wake-up reminders"""
-    now = timezone.now()
-    today = now.date()
-    
-    # Get all user preferences
-    user_prefs = UserPref.objects.filter(
-        student_id__is_active=True
-    ).select_related('student_id')
-    
-    channel_layer = get_channel_layer()
-    
-    for pref in user_prefs:
-        # Create datetime objects for wake-up time today
-        wake_time = timezone.make_aware(
-            timezone.datetime.combine(today, pref.usual_wake_time)
-        )
-        
-        # If it's within 5 minutes of wake-up time
-        if now <= wake_time and now >= (wake_time - timedelta(minutes=5)):
-            student_id = pref.student_id.student_id
-            # Format the wake time nicely
-            formatted_wake_time = wake_time.strftime('%I:%M %p')
-            
-            # Send to user's channel group
-            if is_user_in_foreground(student_id):
-                async_to_sync(channel_layer.group_send)(
-                    f'user_{pref.student_id.student_id}',
-                    {
-                        'type': 'reminder_notification',
-                        'reminder_type': 'wake',
-                        'reminder': f"Good morning! It's time to wake up. Your scheduled wake-up time is {formatted_wake_time}."
-                    }
-                )
-
-
-# Push Notifications
-def send_sleep_push_reminders():
-    now = timezone.now()
-    today = now.date()
-
-    user_prefs = UserPref.objects.filter(
-        student_id__is_active=True
-    ).select_related('student_id')
-
-    for pref in user_prefs:
-        if pref.last_sleep_reminder_date == today:
-            continue
-
-        sleep_time = timezone.make_aware(
-            timezone.datetime.combine(today, pref.usual_sleep_time)
-        )
-        reminder_offset = pref.reminder_offset_time or timedelta(minutes=30)
-        reminder_time = sleep_time - reminder_offset
-
-        if now >= reminder_time and now <= sleep_time:
-            student_id = pref.student_id.student_id
-
-            if not is_user_in_foreground(student_id):
-                title = "Sleep Reminder"
-                body = f"You should be asleep by {sleep_time.strftime('%I:%M %p')}."
-                send_push_notification.delay(student_id, title, body)
-
-                pref.last_sleep_reminder_date = today
-                pref.save()
-
-def send_task_push_reminders():
-    now = timezone.now()
-
-    upcoming_tasks = CustomTask.objects.filter(
-        reminder_sent=False,
-        status__in=['Pending', 'In Progress'],
-        deadline__gt=now,
-    ).select_related('student_id', 'subject_id')
-
-    for task in upcoming_tasks:
-        try:
-            user_pref = UserPref.objects.get(student_id=task.student_id)
-            reminder_offset = user_pref.reminder_offset_time
-        except UserPref.DoesNotExist:
-            reminder_offset = timedelta(minutes=30)
-
-        reminder_time = task.deadline - reminder_offset
-
-        if now >= reminder_time:
-            student_id = task.student_id.student_id
-
-            if not is_user_in_foreground(student_id):
-                subject_name = task.subject_id.subject_title if task.subject_id else "No subject"
-                message = f"{task.task_name} is due soon! Subject: {subject_name}"
-                title = "Task Reminder"
-
-                send_push_notification.delay(student_id, title, message)
-
-                # Mark as sent so it doesn't send again
-                task.reminder_sent = True
-                task.save()
-
-def send_event_push_reminders():
-    now = timezone.now()
-    today = now.date()
-
-    upcoming_events = CustomEvents.objects.filter(
-        reminder_sent=False,
-        scheduled_date__gte=today
-    ).select_related('student_id')
 
-    for event in upcoming_events:
-        try:
-            user_pref = UserPref.objects.get(student_id=event.student_id)
-            reminder_offset = user_pref.reminder_offset_time
-        except UserPref.DoesNotExist:
-            reminder_offset = timedelta(minutes=30)
+                dispatch.deliver(
+                    goal.student_id, 'goal', reminder_data,
+                    "Goal Reminder", f"You have a goal session today for \"{goal.goal_name}\"."
+                )
 
-        event_datetime = timezone.make_aware(
-            timezone.datetime.combine(event.scheduled_date, event.scheduled_start_time)
-        )
-        reminder_time = event_datetime - reminder_offset
+    return counts
 
-        if now >= reminder_time and now < event_datetime:
-            student_id = event.student_id.student_id
+def send_wake_up_reminders(dispatch, since, now, shard=0, shard_count=1):
+    """Check and send wake-up reminders due by `now`"""
+    counts = dispatch.start_sweep()
 
-            if not is_user_in_foreground(student_id):
-                title = "Event Reminder"
-                body = f"{event.event_name} starts soon at {event.scheduled_start_time.strftime('%I:%M %p')}."
-                send_push_notification.delay(student_id, title, body)
+    for due_prefs in claim_rows(
+        get_due_wake_prefs(now).filter(**shard_filter(shard, shard_count)),
+        DueWakePref, dispatch, reschedule=partial(reschedule_wake_reminders, now=now)
+    ):
+        counts['scanned'] += len(due_prefs)
 
-                event.reminder_sent = True
-                event.save()
+        for pref in due_prefs:
+            if is_expired('wake', pref.next_wake_reminder_at, now):
+                dispatch.expire()
+                continue
 
-def send_class_push_reminders():
-    now = timezone.now()
-    today = now.date()
-    current_day = today.strftime("%A")
+            # Format the wake time nicely
+            formatted_wake_time = pref.usual_wake_time.strftime('%I:%M %p')
 
-    class_schedules = CustomClassSchedule.objects.filter(
-        day_of_week=current_day,
-        last_reminder_date__lt=today
-    ).select_related('student_id', 'subject')
+            dispatch.deliver(
+                pref.student_id, 'wake',
+                f"Good morning! It's time to wake up. Your scheduled wake-up time is {formatted_wake_time}.",
+                "Wake-Up Reminder", f"Good morning! Your scheduled wake-up time is {formatted_wake_time}."
+            )
 
-    for class_schedule in class_schedules:
-        try:
-            user_pref = UserPref.objects.get(student_id=class_schedule.student_id)
-            reminder_offset = user_pref.reminder_offset_time
-        except UserPref.DoesNotExist:
-            reminder_offset = timedelta(minutes=30)
+    return counts
 
-        class_datetime = timezone.make_aware(
-            timezone.datetime.combine(today, class_schedule.scheduled_start_time)
-        )
-        reminder_time = class_datetime - reminder_offset
 
-        if now >= reminder_time and now < class_datetime:
-            student_id = class_schedule.student_id.student_id
+# Sweeps run by every shard, with the label used in logs and counts
+REMINDER_SWEEPS = [
+    ('trigger', send_trigger_reminders),
+    ('sleep', send_sleep_reminders),
+    ('wake', send_wake_up_reminders),
+    ('goal', send_goal_reminders),
+]
 
-            if not is_user_in_foreground(student_id):
-                title = f"Class Reminder"
-                body = f"Your class in {class_schedule.subject.subject_code} starts at {class_schedule.scheduled_start_time.strftime('%I:%M %p')} in {class_schedule.room}."
-                send_push_notification.delay(student_id, title, body)
+@shared_task
+def send_all_reminders():
+    """Master function to check and send all types of reminders, fanned out over the reminder shards"""
+    try:
+        token = acquire_tick_lease()
+    except redis.RedisError as e:
+        # Claim-and-mark still keeps overlapping runs from sending twice
+        print(f'Could not take the reminder tick lease, running without it: {str(e)}')
+        token = None
+    else:
+        if token is None:
+            print('Previous reminder tick still running; this tick is coalesced into a catch-up run')
+            return False
 
-                class_schedule.last_reminder_date = today
-                class_schedule.save()
+    print('Starting reminder checks...')
+    shard_count = settings.REMINDER_SHARD_COUNT
+    started_at = time.time()
 
-def send_activity_push_reminders():
-    now = timezone.now()
-    today = now.date()
+    try:
+        # Each sweep picks up where it was last completed, so reminders missed during an outage are caught up
+        windows = {
+            name: since.timestamp()
+            for name, since in sweep_windows([name for name, _ in REMINDER_SWEEPS], from_timestamp(started_at)).items()
+        }
+    except Exception:
+        if token is not None:
+            release_tick_lease(token)
+        raise
+
+    chord(
+        send_reminder_shard.s(shard, shard_count, token, started_at, windows) for shard in range(shard_count)
+    )(collect_reminder_counts.s(started_at=started_at, token=token))
+    return True
 
-    upcoming_activities = CustomActivity.objects.filter(
-        reminder_sent=False,
-        status__in=['Pending', 'In Progress'],
-        scheduled_date__gte=today
-    ).select_related('student_id')
 
-    for activity in upcoming_activities:
+@shared_task
+def send_reminder_shard(shard, shard_count, token=None, started_at=None, windows=None):
+    """Run every reminder sweep for the users of one shard, measuring each, and count the reminders they wrote.
+
+    Every shard of a tick uses its start as the current time; each sweep covers
+    what came due after its entry in `windows` (a timestamp), or the last minute.
+    """
+    counts = {}
+    now = from_timestamp(started_at) if started_at else timezone.now()
+    windows = windows or {}
+
+    # The lease expired and a newer tick took over while this shard was queued
+    if token is not None and not lease_is_current(token):
+        print(f'Skipping stale reminder shard {shard}/{shard_count} (lease {token})')
+        return counts
+
+    # Shards split by user, so one dispatch sees every reminder due for its users this tick
+    dispatch = ReminderDispatch()
+    for name, sweep in REMINDER_SWEEPS:
         try:
-            user_pref = UserPref.objects.get(student_id=activity.student_id)
-            reminder_offset = user_pref.reminder_offset_time
-        except UserPref.DoesNotExist:
-            reminder_offset = timedelta(minutes=30)
-
-        activity_datetime = timezone.make_aware(
-            timezone.datetime.combine(activity.scheduled_date, activity.scheduled_start_time)
-        )
-        reminder_time = activity_datetime - reminder_offset
-
-        if now >= reminder_time and now < activity_datetime:
-            student_id = activity.student_id.student_id
-
-            if not is_user_in_foreground(student_id):
-                title = "Activity Reminder"
-                body = f"{activity.activity_name} starts at {activity.scheduled_start_time.strftime('%I:%M %p')}."
-                send_push_notification.delay(student_id, title, body)
-
-                activity.reminder_sent = True
-                activity.save()
-
-def send_goal_push_reminders():
-    now = timezone.now()
-    today = now.date()
-
-    active_goals = Goals.objects.filter(
-        student_id__is_active=True,
-        last_reminder_date__lt=today
-    ).select_related('student_id')
-
-    for goal in active_goals:
-        send_reminder = False
-        if goal.timeframe == 'Daily':
-            send_reminder = True
-        elif goal.timeframe == 'Weekly' and today.weekday() == 0:
-            send_reminder = True
-        elif goal.timeframe == 'Monthly' and today.day == 1:
-            send_reminder = True
-
-        if send_reminder:
-            today_goal_schedules = GoalSchedule.objects.filter(
-                goal_id=goal,
-                scheduled_date=today,
-                status='Pending'
-            )
-            if today_goal_schedules.exists():
-                student_id = goal.student_id.student_id
-
-                if not is_user_in_foreground(student_id):
-                    title = "Goal Reminder"
-                    body = f"You have a goal session today for \"{goal.goal_name}\"."
-                    send_push_notification.delay(student_id, title, body)
-
-                    goal.last_reminder_date = today
-                    goal.save()
-
-def send_wake_up_push_reminders():
-    now = timezone.now()
-    today = now.date()
-
-    user_prefs = UserPref.objects.filter(
-        student_id__is_active=True
-    ).select_related('student_id')
-
-    for pref in user_prefs:
-        wake_time = timezone.make_aware(
-            timezone.datetime.combine(today, pref.usual_wake_time)
-        )
+            since = from_timestamp(windows[name]) if name in windows else now - timedelta(minutes=1)
+            counts[name] = measure_sweep(sweep, dispatch, since, now, shard, shard_count)
+        except Exception as e:
+            counts[name] = {**new_sweep_counts(), 'errors': 1}
+            print(f'Error processing {name} reminders in shard {shard}/{shard_count}: {str(e)}')
 
-        if now <= wake_time and now >= (wake_time - timedelta(minutes=5)):
-            student_id = pref.student_id.student_id
+    # Each sweep wrote its reminders chunk by chunk; a failed one left nothing behind
+    counts['deliver'] = dispatch.written
+    return counts
 
-            if not is_user_in_foreground(student_id):
-                title = "Wake-Up Reminder"
-                body = f"Good morning! Your scheduled wake-up time is {wake_time.strftime('%I:%M %p')}."
-                send_push_notification.delay(student_id, title, body)
 
 @shared_task
-def send_all_reminders():
-    """Master function to check and send all types of reminders"""
-    print('Starting reminder checks...')
-    
-    try:
-        send_task_reminders()
-        print('Task reminders processed')
-    except Exception as e:
-        print(f'Error processing task reminders: {str(e)}')
-    
-    try:
-        send_event_reminders()
-        print('Event reminders processed')
-    except Exception as e:
-        print(f'Error processing event reminders: {str(e)}')
-    
-    try:
-        send_activity_reminders()
-        print('Activity reminders processed')
-    except Exception as e:
-        print(f'Error processing activity reminders: {str(e)}')
-    
-    try:
-        send_class_reminders()
-        print('Class reminders processed')
-    except Exception as e:
-        print(f'Error processing class reminders: {str(e)}')
-    
-    try:
-        send_sleep_reminders()
-        print('Sleep reminders processed')
-    except Exception as e:
-        print(f'Error processing sleep reminders: {str(e)}')
-    
-    try:
-        send_wake_up_reminders()
-        print('Wake-up reminders processed')
-    except Exception as e:
-        print(f'Error processing wake-up reminders: {str(e)}')
-    
-    try:
-        send_goal_reminders()
-        print('Goal reminders processed')
-    except Exception as e:
-        print(f'Error processing goal reminders: {str(e)}')
-
-    try:
-        send_sleep_push_reminders()
-        print('Sleep push reminders processed')
-    except Exception as e:
-        print(f'Error processing sleep PUSH reminders: {str(e)}')
-
-    try:
-        send_task_push_reminders()
-        print('Task push reminders processed')
-    except Exception as e:
-        print(f'Error processing task PUSH reminders: {str(e)}')
+def collect_reminder_counts(shard_counts, started_at, token=None):
+    """Chord callback adding up the shards' sweep counts, recording the tick and releasing its lease.
 
+    The high-water mark of a sweep only moves up to this tick if every shard completed it.
+    """
     try:
-        send_event_push_reminders()
-        print('Event push reminders processed')
-    except Exception as e:
-        print(f'Error processing event PUSH reminders: {str(e)}')
+        advance_watermarks([
+            name for name, _ in REMINDER_SWEEPS
+            if all(name in counts and not counts[name].get('errors') for counts in shard_counts)
+        ], from_timestamp(started_at))
+        tick = record_tick(merge_shard_counts(shard_counts), started_at)
+        print(f"All reminder checks completed in {tick['seconds']}s: {tick['sweeps']}")
+    finally:
+        pending = release_tick_lease(token) if token is not None else 0
+
+    # Ticks that arrived while this one ran are folded into a single catch-up run
+    if pending:
+        print(f'{pending} reminder ticks arrived during this one; starting a catch-up run')
+        send_all_reminders.delay()
+    return tick
+
+
+@shared_task(bind=True)
+def send_push_notification(self, user_id, title, message):
+    """Push one notification to all of a user's devices; returns its FCM message ID, or None"""
+    result = send_push_batch([{'user_id': str(user_id), 'title': title, 'body': message, 'urgent': True}])[0]
+    if result['status'] == 'throttled':
+        raise self.retry(countdown=result['retry_after'])
+    if result['status'] == 'no_token':
+        print(f"No FCM token found for user {user_id}")
+    elif not result['success']:
+        print(f"Error sending notification to user {user_id}: {result['error']}")
+    else:
+        print(f"Push notification sent to user {user_id} on {result['delivered']} of {result['devices']} devices")
+    return result['message_id']
 
-    try:
-        send_class_push_reminders()
-        print('Class push reminders processed')
-    except Exception as e:
-        print(f'Error processing class PUSH reminders: {str(e)}')
 
-    try:
-        send_activity_push_reminders()
-        print('Activity PUSH reminders processed')
-    except Exception as e:
-        print(f'Error processing activity PUSH reminders: {str(e)}')
+# Point the FCM client at another endpoint, e.g. the fcm_stub command, when configured
+if settings.FCM_ENDPOINT:
+    messaging._MessagingService.FCM_URL = settings.FCM_ENDPOINT.rstrip('/') + '/v1/projects/{0}/messages:send'
 
-    try:
-        send_goal_push_reminders()
-        print('Goal PUSH reminders processed')
-    except Exception as e:
-        print(f'Error processing goal PUSH reminders: {str(e)}')
 
-    try:
-        send_wake_up_push_reminders()
-        print('Wake-up PUSH reminders processed')
-    except Exception as e:
-        print(f'Error processing wake-up PUSH reminders: {str(e)}')
-    
-    print('All reminder checks completed')
-    return True
+def send_messages(messages):
+    """Send FCM messages through the configured PUSH_BACKEND, PUSH_BATCH_SIZE per call; returns a messaging.BatchResponse"""
+    send_each = fcm_client.send_each if settings.PUSH_BACKEND == 'http2' else messaging.send_each
+    responses = []
+    for start in range(0, len(messages), settings.PUSH_BATCH_SIZE):
+        responses += send_each(messages[start:start + settings.PUSH_BATCH_SIZE]).responses
+    return messaging.BatchResponse(responses)
 
 
 @shared_task
-def send_push_notification(user_id, title, message):
-    try:
-        token = FCMToken.objects.get(user_id=user_id).token
+def send_push_batch(pushes):
+    """Send a batch of {'user_id', 'title', 'body'[, 'data', 'tokens', 'urgent']} pushes to every device of each user with one FCM batch call.
+
+    Pushes that do not carry their tokens are looked up in the token cache.
+    Returns one {'user_id', 'status', 'success', 'message_id', 'error', 'devices', 'delivered', 'retry_after'}
+    result per push, in order, after deleting the tokens FCM reported as permanently dead.
+    A push succeeds when any of its devices received it. Pushes over the shared rate limit are
+    not sent; they come back 'throttled' with the seconds to wait before sending them again.
+    """
+    tokens = get_tokens(push['user_id'] for push in pushes if 'tokens' not in push)
+
+    results = [
+        {
+            'user_id': push['user_id'], 'status': None, 'success': False, 'message_id': None, 'error': None,
+            'devices': 0, 'delivered': 0, 'retry_after': None,
+        } for push in pushes
+    ]
+    lanes = {lane: [] for lane in LANES}
+
+    for result, push in zip(results, pushes):
+        user_tokens = push['tokens'] if 'tokens' in push else tokens.get(push['user_id'], [])
+        if not user_tokens:
+            result['status'] = 'no_token'
+            result['error'] = 'No FCM token found'
+            continue
 
-        # Build the message payload
-        message = messaging.Message(
-            notification=messaging.Notification(
-                title=title,
-                body=message
-            ),
-            token=token
-        )
+        result['devices'] = len(user_tokens)
+        lanes['urgent' if push.get('urgent') else 'normal'].append((result, push, user_tokens))
+
+    # One message per device; FCM has no multi-token send, so a user's devices share the batch call instead
+    messages, sent = [], []
+
+    # Urgent pushes take their share of the shared rate limit first
+    for lane, lane_pushes in lanes.items():
+        granted, retry_after = acquire_push_quota([len(user_tokens) for _, _, user_tokens in lane_pushes], lane)
+        for result, _, _ in lane_pushes[granted:]:
+            result['status'] = 'throttled'
+            result['error'] = 'Push rate limit reached'
+            result['retry_after'] = retry_after
+
+        for result, push, user_tokens in lane_pushes[:granted]:
+            for token in user_tokens:
+                messages.append(messaging.Message(
+                    notification=messaging.Notification(
+                        title=push['title'],
+                        body=push['body']
+                    ),
+                    data=push.get('data'),
+                    token=token
+                ))
+                sent.append(result)
+
+    device_statuses = []
+    if messages:
+        try:
+            response = send_messages(messages)
+            for result, send_response in zip(sent, response.responses):
+                if send_response.exception:
+                    device_statuses.append(classify_send_error(send_response.exception))
+                    result['error'] = str(send_response.exception)
+                else:
+                    device_statuses.append('sent')
+                    result['delivered'] += 1
+                    result['message_id'] = result['message_id'] or send_response.message_id
+        except Exception as e:
+            device_statuses = [classify_send_error(e)] * len(messages)
+            for result in sent:
+                result['error'] = str(e)
+
+    # A push is retried when no device got it and any device might still get it later
+    statuses = {}
+    for result, status in zip(sent, device_statuses):
+        statuses.setdefault(id(result), set()).add(status)
+    for result in results:
+        if result['status'] in ('no_token', 'throttled'):
+            continue
+        user_statuses = statuses[id(result)]
+        if result['delivered']:
+            result['status'] = 'sent'
+            result['success'] = True
+            result['error'] = None
+        elif 'transient' in user_statuses:
+            result['status'] = 'transient'
+        elif 'error' in user_statuses:
+            result['status'] = 'error'
+        else:
+            result['status'] = user_statuses.pop()
+
+    pruned = prune_tokens([
+        (result['user_id'], message.token)
+        for result, message, status in zip(sent, messages, device_statuses) if status in DEAD_TOKEN_STATUSES
+    ])
+
+    succeeded = sum(result['success'] for result in results)
+    throttled = sum(result['status'] == 'throttled' for result in results)
+    devices = sum(result['delivered'] for result in results)
+    print(
+        f'Push batch sent: {succeeded} succeeded, {len(results) - succeeded - throttled} failed, '
+        f'{throttled} throttled, {devices} of {len(messages)} devices reached, {pruned} dead tokens pruned'
+    )
+    return results
 
-        print(f"📦 Sending FCM payload to {user_id}: {message}")
-        response = messaging.send(message)
-        print(f'Push notification sent to user {user_id}: {response}')
-        return response
 
-    except FCMToken.DoesNotExist:
-        print(f"No FCM token found for user {user_id}")
-        return None
-    except Exception as e:
-        print(f"Error sending notification to user {user_id}: {str(e)}")
-        return None
+@shared_task
+def prune_stale_devices():
+    """Delete device tokens that have not checked in for FCM_DEVICE_STALE_AFTER; FCM stops delivering to them anyway"""
+    pruned = delete_tokens(FCMToken.objects.filter(last_seen__lt=timezone.now() - settings.FCM_DEVICE_STALE_AFTER))
+    print(f'Pruned {pruned} stale FCM device tokens')
+    return pruned
@@ -1,3 +1,109 @@
-from django.test import TestCase
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from .models import (
+    CustomUser, UserPref, NotificationOutbox, CustomSemester, CustomSubject, CustomClassSchedule, ReminderTrigger
+)
+from .reminder_catch_up import is_expired, is_missed
+from .tasks import ReminderDispatch, send_wake_up_reminders, send_due_triggers
 
-# Create your tests here.
+
+class CatchUpPolicyTests(SimpleTestCase):
+    def test_due_in_the_last_minute_is_not_missed(self):
+        now = timezone.now()
+        self.assertFalse(is_missed(now - timedelta(seconds=30), now))
+        self.assertTrue(is_missed(now - timedelta(minutes=20), now))
+
+    def test_missed_wake_up_reminder_expires(self):
+        now = timezone.now()
+        self.assertTrue(is_expired('wake', now - timedelta(minutes=20), now))
+        self.assertFalse(is_expired('wake', now - timedelta(seconds=30), now))
+
+    def test_missed_sleep_reminder_is_delivered_within_the_limit(self):
+        now = timezone.now()
+        self.assertFalse(is_expired('sleep', now - timedelta(minutes=20), now))
+        self.assertTrue(is_expired('sleep', now - timedelta(hours=2), now))
+
+
+class WakeUpSweepTests(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user('Test', 'User', 'test@example.com', 'test', 'pw12345!')
+        UserPref.objects.create(
+            student_id=user, usual_sleep_time=time(23), usual_wake_time=time(7),
+            reminder_offset_time=timedelta(minutes=30)
+        )
+
+    def sweep(self, due_ago):
+        now = timezone.now()
+        UserPref.objects.update(next_wake_reminder_at=now - due_ago)
+        # The last completed tick was half an hour ago
+        return send_wake_up_reminders(ReminderDispatch(), now - timedelta(minutes=30), now)
+
+    def test_wake_up_reminder_due_during_an_outage_expires(self):
+        counts = self.sweep(timedelta(minutes=20))
+        self.assertEqual(counts['expired'], 1)
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_wake_up_reminder_due_this_minute_is_sent(self):
+        counts = self.sweep(timedelta(seconds=10))
+        self.assertEqual(counts['due'], 1)
+        self.assertEqual(NotificationOutbox.objects.get().reminder_type, 'wake')
+
+
+class ClassTriggerTests(TestCase):
+    def test_class_trigger_keeps_its_local_time_across_dst(self):
+        user = CustomUser.objects.create_user('Test', 'User', 'test@example.com', 'test', 'pw12345!')
+        UserPref.objects.create(
+            student_id=user, usual_sleep_time=time(23), usual_wake_time=time(7),
+            reminder_offset_time=timedelta(minutes=30), time_zone='America/New_York'
+        )
+        semester = CustomSemester.objects.create(
+            acad_year_start=2026, acad_year_end=2027, year_level='1st Year', semester='1st Semester',
+            sem_start_date=date(2026, 8, 1), sem_end_date=date(2026, 12, 31), student_id=user
+        )
+        subject = CustomSubject.objects.create(
+            subject_code='CS1', subject_title='Intro', student_id=user, semester_id=semester
+        )
+        class_schedule = CustomClassSchedule.objects.create(
+            subject=subject, day_of_week='Sunday', scheduled_start_time=time(9),
+            scheduled_end_time=time(10), room='R1', student_id=user
+        )
+        # Sunday 25 October 2026, 09:00 EDT; New York leaves DST the week after
+        starts_at = datetime(2026, 10, 25, 13, tzinfo=dt_timezone.utc)
+        trigger = ReminderTrigger.objects.create(
+            category_type='Class', reference_id=class_schedule.classsched_id, student_id=user,
+            offset=timedelta(minutes=30), starts_at=starts_at, fire_at=starts_at - timedelta(minutes=30)
+        )
+
+        send_due_triggers(ReminderTrigger.objects.all(), trigger.fire_at, ReminderDispatch())
+
+        trigger.refresh_from_db()
+        self.assertFalse(trigger.fired)
+        # 09:00 EST
+        self.assertEqual(trigger.starts_at, datetime(2026, 11, 1, 14, tzinfo=dt_timezone.utc))
+        self.assertEqual(trigger.fire_at, datetime(2026, 11, 1, 13, 30, tzinfo=dt_timezone.utc))
+        self.assertEqual(NotificationOutbox.objects.get().reminder_type, 'class')
+
+
+class DailyReminderScheduleTests(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user('Test', 'User', 'test@example.com', 'test', 'pw12345!')
+        UserPref.objects.create(
+            student_id=user, usual_sleep_time=time(23), usual_wake_time=time(7),
+            reminder_offset_time=timedelta(minutes=30)
+        )
+        # Due a moment ago, not yet claimed by a tick
+        self.due_at = timezone.now() - timedelta(seconds=20)
+        UserPref.objects.update(next_wake_reminder_at=self.due_at)
+
+    def test_unrelated_change_keeps_a_pending_reminder(self):
+        user_pref = UserPref.objects.get()
+        user_pref.mute_push = True
+        user_pref.save()
+        self.assertEqual(UserPref.objects.get().next_wake_reminder_at, self.due_at)
+
+    def test_new_wake_time_moves_the_reminder(self):
+        user_pref = UserPref.objects.get()
+        user_pref.usual_wake_time = '06:30'
+        user_pref.save()
+        self.assertGreater(UserPref.objects.get().next_wake_reminder_at, timezone.now())
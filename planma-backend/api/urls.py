@@ -24,6 +24,7 @@ router.register(r'users', CustomUserViewSet, basename='user')
 router.register(r'schedule', ScheduleEntryViewSet, basename='schedule')
 router.register(r'fcm-token', FCMTokenViewSet, basename='fcm-token')
 router.register(r'your-user', YourUserViewSet, basename='your-user')
+router.register(r'reminder-stats', ReminderStatsViewSet, basename='reminder-stats')
 
 urlpatterns = [
     path ('djoser/', include ('djoser.urls')),
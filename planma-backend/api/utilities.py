@@ -1,15 +1,17 @@
 from .models import UserPref
 from django.utils import timezone
 from datetime import timedelta
+from zoneinfo import ZoneInfo
 
 def get_sleep_reminders(student_id: UserPref):
     
     now = timezone.now()
-    today = now.date()
 
     # Get user preference for sleep time
     try:
         user_pref = UserPref.objects.get(student_id=student_id)
+        zone = ZoneInfo(user_pref.time_zone)
+        today = timezone.localdate(now, zone)
 
         # Skip if reminder already sent today
         if user_pref.last_sleep_reminder_date == today:
@@ -20,7 +22,7 @@ def get_sleep_reminders(student_id: UserPref):
 
         # Create a datetime object for sleep time
         sleep_datetime = timezone.make_aware(
-            timezone.datetime.combine(today, sleep_time)
+            timezone.datetime.combine(today, sleep_time), zone
         )
 
         # Calculate when reminder should be sent
@@ -13,9 +13,15 @@ from django.shortcuts import get_object_or_404
 from datetime import datetime, timedelta
 from django.core.exceptions import ValidationError, PermissionDenied
 from django.utils.timezone import make_aware, now
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse
 from datetime import datetime, timedelta
-from api.tasks import send_push_notification
+from api.notification_outbox import notify
+from api.reminders import (
+    schedule_task_reminders, schedule_event_reminders, schedule_activity_reminders,
+    schedule_class_reminders, clear_reminders, rebuild_reminders, get_user_pref, user_time_zone
+)
+from api.reminder_stats import recent_ticks, summarize_ticks, prometheus_text
+from api.push_tokens import forget_tokens
 
 # views.py
 # from djoser.views import TokenCreateView
@@ -121,6 +127,9 @@ class ActivityViewSet(viewsets.ModelViewSet):
             )
             print(f"ScheduleEntry created successfully!")
 
+            # Arm the activity's reminder triggers
+            schedule_activity_reminders(activity)
+
             # Serialize and return the created data
             serializer = self.get_serializer(activity)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -208,6 +217,9 @@ class ActivityViewSet(viewsets.ModelViewSet):
                 schedule_entry.scheduled_end_time = end_time
                 schedule_entry.save()
 
+            # Move the reminder triggers along with the schedule
+            schedule_activity_reminders(instance)
+
             # Serialize and return the updated data
             serializer = self.get_serializer(instance)
             return Response(serializer.data, status=status.HTTP_200_OK)
@@ -288,6 +300,9 @@ class ActivityTimeLogViewSet(viewsets.ModelViewSet):
             activity.status = "Completed"
             activity.save()
 
+            # No more reminders once the activity is done
+            clear_reminders('Activity', activity.activity_id)
+
             # Serialize and return the created time log
             serializer = self.get_serializer(log)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -401,6 +416,9 @@ class EventViewSet(viewsets.ModelViewSet):
             )
             print(f"ScheduleEntry created successfully!")
 
+            # Arm the event's reminder triggers
+            schedule_event_reminders(event)
+
             # Serialize and return the created data
             serializer = self.get_serializer(event)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -491,6 +509,9 @@ class EventViewSet(viewsets.ModelViewSet):
                 schedule_entry.scheduled_end_time = end_time
                 schedule_entry.save()
 
+            # Move the reminder triggers along with the schedule
+            schedule_event_reminders(instance)
+
             # Serialize and return the updated data
             serializer = self.get_serializer(instance)
             return Response(serializer.data, status=status.HTTP_200_OK)
@@ -607,6 +628,12 @@ class UserPreferenceView(viewsets.ModelViewSet):
     
     def perform_create(self, serializer):
         serializer.save(student_id=self.request.user)
+        # Re-time the user's pending reminders to the new offset
+        rebuild_reminders(self.request.user.student_id)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        rebuild_reminders(self.request.user.student_id)
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -819,6 +846,9 @@ class ClassScheduleViewSet(viewsets.ModelViewSet):
 
             print(f"ScheduleEntries created successfully for class schedule!")
 
+            # Arm the class's reminder triggers for its next meeting
+            schedule_class_reminders(class_schedule)
+
             # Serialize and return the created data
             serializer = self.get_serializer(class_schedule)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -887,6 +917,9 @@ class ClassScheduleViewSet(viewsets.ModelViewSet):
             instance.room = data["room"]
             instance.save()
 
+            # Move the reminder triggers along with the schedule
+            schedule_class_reminders(instance)
+
             serializer = self.get_serializer(instance)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -1214,8 +1247,10 @@ class TaskViewSet(viewsets.ModelViewSet):
             return Response({'error': 'All fields are required except student_id.'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            # Convert deadline to timezone-aware datetime
-            deadline = make_aware(datetime.strptime(deadline_str, "%Y-%m-%dT%H:%M"))
+            # Convert deadline to a timezone-aware datetime in the user's zone
+            deadline = make_aware(
+                datetime.strptime(deadline_str, "%Y-%m-%dT%H:%M"), user_time_zone(get_user_pref(student_id))
+            )
         except ValueError:
             return Response(
                 {'error': 'Invalid deadline format. Use "YYYY-MM-DDTHH:MM".'},
@@ -1278,6 +1313,9 @@ class TaskViewSet(viewsets.ModelViewSet):
             )
             print(f"ScheduleEntry created successfully!")
 
+            # Arm the task's reminder triggers
+            schedule_task_reminders(task)
+
             # Serialize and return the created data
             serializer = self.get_serializer(task)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -1318,8 +1356,11 @@ class TaskViewSet(viewsets.ModelViewSet):
             return Response({'error': 'All fields are required.'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            # Convert deadline to timezone-aware datetime
-            deadline = make_aware(datetime.strptime(deadline_str, "%Y-%m-%dT%H:%M"))
+            # Convert deadline to a timezone-aware datetime in the user's zone
+            deadline = make_aware(
+                datetime.strptime(deadline_str, "%Y-%m-%dT%H:%M"),
+                user_time_zone(get_user_pref(instance.student_id_id))
+            )
         except ValueError:
             return Response(
                 {'error': 'Invalid deadline format. Use "YYYY-MM-DDTHH:MM".'},
@@ -1380,6 +1421,9 @@ class TaskViewSet(viewsets.ModelViewSet):
                 schedule_entry.scheduled_end_time = end_time
                 schedule_entry.save()
 
+            # Move the reminder triggers along with the schedule
+            schedule_task_reminders(instance)
+
             # Serialize and return the updated data
             serializer = self.get_serializer(instance)
             return Response(serializer.data, status=status.HTTP_200_OK)
@@ -1460,6 +1504,9 @@ class TaskTimeLogViewSet(viewsets.ModelViewSet):
             task.status = "Completed"
             task.save()
 
+            # No more reminders once the task is done
+            clear_reminders('Task', task.task_id)
+
             # Serialize and return the created time log
             serializer = self.get_serializer(log)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -2013,18 +2060,40 @@ class FCMTokenViewSet(viewsets.ModelViewSet):
         # Only allow users to access their own FCM token
         return self.queryset.filter(user=self.request.user)
 
+    def get_serializer_class(self):
+        if self.action == 'register':
+            return FCMTokenRegisterSerializer
+        return FCMTokenSerializer
+
+    def perform_create(self, serializer):
+        fcm_token = serializer.save(user=self.request.user)
+        forget_tokens([fcm_token.user_id])
+
+    def perform_update(self, serializer):
+        fcm_token = serializer.save()
+        forget_tokens([fcm_token.user_id])
+
+    def perform_destroy(self, instance):
+        user_id = instance.user_id
+        instance.delete()
+        forget_tokens([user_id])
+
     @action(detail=False, methods=['post'])
     def register(self, request):
         """
-        Registers or updates the FCM token for the authenticated user.
+        Registers the FCM token of the device the authenticated user is signed in on.
+        Each device keeps its own token; registering again refreshes its last-seen time.
         """
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
             token = serializer.validated_data['token']
+            previous_owner = FCMToken.objects.filter(token=token).values_list('user_id', flat=True).first()
             fcm_token, created = FCMToken.objects.update_or_create(
-                user=request.user,
-                defaults={'token': token}
+                token=token,
+                defaults={'user': request.user, 'last_seen': now()}
             )
+            # The device may have been signed in to another account before
+            forget_tokens({request.user.student_id, previous_owner} - {None})
             return Response({
                 "message": "Token saved successfully.",
                 "created": created
@@ -2041,11 +2110,34 @@ class YourUserViewSet(viewsets.ModelViewSet):
         student_id = request.data.get('student_id')
         if not student_id:
             return Response({"error": "Missing student_id"}, status=400)
+        if not CustomUser.objects.filter(student_id=student_id).exists():
+            return Response({"error": "Unknown student_id"}, status=404)
 
-        # Send a test push
-        send_push_notification.delay(
+        # Queue a test push for the notification relay
+        notify(
             student_id,
             "🔔 Test Push",
             "This is a manual test notification"
         )
-        return Response({"status": "Push triggered"}, status=200)
\ No newline at end of file
+        return Response({"status": "Push triggered"}, status=200)
+
+
+# Reminder engine monitoring
+class ReminderStatsViewSet(viewsets.ViewSet):
+    permission_classes = [permissions.IsAdminUser]
+
+    def list(self, request):
+        """
+        Per-sweep timings and counts over the recent reminder ticks.
+        """
+        return Response(summarize_ticks(recent_ticks()))
+
+    @action(detail=False, methods=['get'])
+    def metrics(self, request):
+        """
+        The same summary in the Prometheus text format.
+        """
+        return HttpResponse(
+            prometheus_text(summarize_ticks(recent_ticks())),
+            content_type='text/plain; version=0.0.4'
+        )
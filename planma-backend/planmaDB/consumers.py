@@ -1,14 +1,11 @@
 import json 
 from channels.generic.websocket import AsyncWebsocketConsumer
 from django.utils import timezone
-from django.utils.timezone import now
 import asyncio
 from datetime import timedelta
 from channels.db import database_sync_to_async
 from api.utilities import get_sleep_reminders
-import redis
-
-r = redis.Redis()
+from api.presence import set_foreground
 
 class ReminderConsumer(AsyncWebsocketConsumer):
     def __init__(self, *args, **kwargs):
@@ -61,14 +58,7 @@ class ReminderConsumer(AsyncWebsocketConsumer):
             await self.check_reminders()
 
     async def set_foreground_status(self, foreground: bool):
-        key = f"user_online:{self.student_id}"
-        if foreground:
-            r.set(key, json.dumps({
-                    "last_seen": now().isoformat(),
-                    "foreground": True
-            }), ex=300)
-        else:
-            r.delete(key)
+        set_foreground(self.student_id, foreground)
 
     # Send reminder to WebSocket
     async def reminder_notification(self, event):
@@ -83,6 +73,11 @@ class ReminderConsumer(AsyncWebsocketConsumer):
                 'reminder': reminder
             })
         )
+
+    # Everything due for this user in one reminder tick, sent to the WebSocket one reminder at a time
+    async def reminder_notifications(self, event):
+        for reminder in event['reminders']:
+            await self.reminder_notification(reminder)
     
     # Periodic check for reminders
     async def periodic_reminder_check(self):
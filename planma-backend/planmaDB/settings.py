@@ -84,6 +84,8 @@ WSGI_APPLICATION = 'planmaDB.wsgi.application'
 # Use ASGI instead of WSGI
 ASGI_APPLICATION = 'planmaDB.asgi.application'
 
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
 # Redis as channel layer (make sure Redis is installed and running)
 CHANNEL_LAYERS = {
     'default': {
@@ -96,7 +98,7 @@ CHANNEL_LAYERS = {
         'CONFIG': {
             # "hosts": [('127.0.0.1', 6379)],
             # "hosts": [('localhost', 6379)],
-            "hosts": [os.getenv("REDIS_URL", "redis://localhost:6379/0")],
+            "hosts": [REDIS_URL],
         },
     },
 }
@@ -239,18 +241,125 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 # CELERY_TIMEZONE = 'UTC'
 CELERY_TIMEZONE = 'Asia/Manila'
-CELERY_WORKER_POOL = 'solo'
-CELERY_WORKER_CONCURRENCY = 4
+# Reminder sweeps and push I/O run on separate queues, each served by its own worker, so a
+# slow FCM backlog never holds up the next tick:
+#   celery -A planmaDB worker -Q reminders -P prefork -c 4 --prefetch-multiplier 1
+#   celery -A planmaDB worker -Q push -P threads -c 50 --prefetch-multiplier 4
+# The prefork pool does not run on Windows; pass -P solo there for development
+CELERY_TASK_DEFAULT_QUEUE = 'reminders'
+CELERY_TASK_ROUTES = {
+    'api.tasks.send_all_reminders': {'queue': 'reminders'},
+    'api.tasks.send_reminder_shard': {'queue': 'reminders'},
+    'api.tasks.collect_reminder_counts': {'queue': 'reminders'},
+    'api.tasks.send_push_notification': {'queue': 'push'},
+    'api.tasks.send_push_batch': {'queue': 'push'},
+    'api.tasks.prune_stale_devices': {'queue': 'push'},
+}
+# One shard per process; a worker reserves no more tasks than it is running, so queued
+# shards go to whichever worker is free
+CELERY_WORKER_CONCURRENCY = int(os.getenv("CELERY_WORKER_CONCURRENCY", 4))
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Results are fire-and-forget except for the shards, which the tick's chord collects
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_RESULT_EXPIRES = 60 * 60
 CELERY_TASK_ANNOTATIONS = {
-    
+    # A shard lost with its worker is redelivered; claim-and-mark keeps the rerun from sending
+    # twice. Push tasks keep the default early ack, so a worker crash never sends one twice.
+    'api.tasks.send_reminder_shard': {'ignore_result': False, 'acks_late': True, 'reject_on_worker_lost': True},
 }
 
 CELERY_BEAT_SCHEDULE = {
     'check-reminders-every-minute': {
         'task': 'api.tasks.send_all_reminders',
         'schedule': crontab(minute='*'),  # Every minute
-    }
+        # A tick still queued when the next one is due is dropped; the next tick catches up
+        'options': {'expire_seconds': 55},
+    },
+    'prune-stale-devices-daily': {
+        'task': 'api.tasks.prune_stale_devices',
+        'schedule': crontab(hour=4, minute=0),  # Daily at 04:00
+    },
+}
+
+# Reminder Configuration
+# Offsets fired on top of each user's reminder_offset_time, per category,
+# e.g. {'Task': [timedelta(days=1), timedelta(hours=1)]}
+REMINDER_EXTRA_OFFSETS = {}
+# Reminders that came due while no tick ran (a worker, Redis or beat outage) are caught up
+# by the next tick: 'deliver' sends them late, 'expire' drops them. Anything due longer ago
+# than the limit is expired regardless.
+REMINDER_CATCH_UP_POLICY = {
+    'trigger': 'deliver',  # Items that have already started are always expired
+    'sleep': 'deliver',
+    'wake': 'expire',  # A late wake-up call is no use
 }
+REMINDER_CATCH_UP_LIMIT = timedelta(hours=1)
+# Reminder types held back during a user's quiet hours and classes, or until their next digest;
+# task deadlines, classes, sleep and wake-up reminders always go out at once
+REMINDER_HOLD_TYPES = {'goal', 'activity', 'event'}
+# How often users in digest mode get the reminders collected since the last digest
+REMINDER_DIGEST_INTERVAL = timedelta(hours=1)
+# Due rows a sweep claims and holds at a time, which bounds worker memory however many
+# reminders are due; each chunk's reminders are written to the outbox as it is claimed
+REMINDER_CHUNK_SIZE = 1000
+# Shard tasks each reminder tick fans out into; raise along with worker processes/hosts
+REMINDER_SHARD_COUNT = int(os.getenv("REMINDER_SHARD_COUNT", 4))
+# Each tick should finish before the next one starts; warn once it uses this share of the budget
+REMINDER_TICK_BUDGET = 60
+REMINDER_TICK_WARNING_RATIO = 0.8
+# Only one tick runs at a time; its lease expires after this many seconds if a worker dies mid-tick
+REMINDER_TICK_LEASE_TTL = 2 * REMINDER_TICK_BUDGET
+# Ticks kept for `manage.py reminder_stats` and the reminder-stats endpoint
+REMINDER_STATS_WINDOW = 60
+
+# Push Notification Configuration
+# Messages sent per FCM batch call (FCM accepts at most 500); a push to a user with several
+# devices is one message per device
+PUSH_BATCH_SIZE = 500
+# Bytes of title, body and data a push combining several reminders may use; FCM rejects
+# messages over 4096 bytes, and the rest of the message takes up part of that
+PUSH_PAYLOAD_LIMIT = 3500
+# Base URL of the FCM v1 API; set to a local stub (manage.py fcm_stub) for testing
+FCM_ENDPOINT = os.getenv("FCM_ENDPOINT")
+# How pushes are sent: 'firebase_admin' (blocking, one thread per message) or
+# 'http2' (api.fcm_client, concurrent sends over a pooled HTTP/2 connection)
+PUSH_BACKEND = os.getenv("PUSH_BACKEND", "firebase_admin")
+# Limits of the http2 backend: sends awaiting a response, pooled connections (HTTP/2
+# multiplexes sends over few of them; a plain-HTTP stub gets HTTP/1.1, one send per
+# connection), seconds per request
+FCM_MAX_IN_FLIGHT = 200
+FCM_MAX_CONNECTIONS = 100
+FCM_TIMEOUT = 10
+# How long FCM tokens, and the absence of one, stay cached in Redis
+FCM_TOKEN_CACHE_TTL = 24 * 60 * 60
+FCM_NO_TOKEN_CACHE_TTL = 60 * 60
+# Shared send rate of all push workers, enforced by a token bucket in Redis: on average
+# PUSH_RATE_LIMIT FCM messages per second (FCM allows 600,000 per minute per project), in
+# bursts of up to PUSH_RATE_BURST. Pushes over the limit wait in the outbox for their turn.
+PUSH_RATE_LIMIT = int(os.getenv("PUSH_RATE_LIMIT", 5000))
+PUSH_RATE_BURST = 10000
+# Reminder types pushed through the urgent lane: claimed from the outbox first and allowed
+# to use the last PUSH_URGENT_RESERVE messages of the bucket, which goal nudges and other
+# reminders leave to them
+PUSH_URGENT_TYPES = {'task', 'class', 'wake', 'notification'}
+PUSH_URGENT_RESERVE = 2000
+# Devices whose app has not re-registered its token for this long are deleted by the daily
+# prune_stale_devices task; FCM treats tokens inactive for over a month as stale
+FCM_DEVICE_STALE_AFTER = timedelta(days=60)
+
+# Notification Outbox Configuration
+# Messages the relay (manage.py run_notification_relay) claims per batch; a user's messages
+# in one batch go out as one in-app message or push, so keep it within PUSH_BATCH_SIZE
+OUTBOX_BATCH_SIZE = 500
+# Seconds the relay waits when the outbox is empty
+OUTBOX_POLL_INTERVAL = 1
+# A claimed batch is retried by any relay once this long has passed without it being settled,
+# e.g. after a relay died mid-batch
+OUTBOX_LEASE = timedelta(minutes=2)
+# Failed deliveries are retried after OUTBOX_RETRY_DELAY, doubling per attempt, and given up
+# on after OUTBOX_MAX_ATTEMPTS
+OUTBOX_RETRY_DELAY = timedelta(seconds=10)
+OUTBOX_MAX_ATTEMPTS = 6
 
 # settings.py
 
@@ -268,6 +377,10 @@ LOGGING = {
             'level': 'DEBUG',
             'handlers': ['console'],
         },
+        'api': {
+            'level': 'INFO',
+            'handlers': ['console'],
+        },
     },
 }
 